@@ -1,91 +1,11 @@
-import json
-import os
-import subprocess
-import sys
-
-_DIR = os.path.dirname(os.path.abspath(__file__))
-_NSFW_DIR = os.path.join(_DIR, "nsfw_pack")
-_CONFIG_PATH = os.path.join(_DIR, "config.json")
-
-
-def _load_config():
-    """Load config.json, return defaults if missing or malformed."""
-    try:
-        with open(_CONFIG_PATH, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"nsfw": False}
-
-
-def _nsfw_populated():
-    """Check if nsfw_pack/ has Python files (not just .git metadata)."""
-    if not os.path.isdir(_NSFW_DIR):
-        return False
-    return any(f.endswith(".py") for f in os.listdir(_NSFW_DIR))
-
-
-_NSFW_REPO = "https://github.com/artokun/ComfyUI-Photoreal-Prompt-Builder-NSFW.git"
-
-
-def _is_git_repo():
-    """Check if the node pack was installed as a git repo (clone) vs zip."""
-    return os.path.isdir(os.path.join(_DIR, ".git"))
-
-
-def _fetch_nsfw():
-    """Fetch the nsfw_pack module. Uses git submodule if available,
-    otherwise falls back to a direct clone (for zip/tarball installs)."""
-    try:
-        if _is_git_repo():
-            # Git clone install — use submodule
-            subprocess.run(
-                ["git", "submodule", "update", "--init", "--", "nsfw_pack"],
-                cwd=_DIR, capture_output=True, timeout=60,
-            )
-        else:
-            # Zip/tarball install (ComfyUI Manager) — direct clone into nsfw_pack/
-            import shutil
-            if os.path.isdir(_NSFW_DIR):
-                shutil.rmtree(_NSFW_DIR)
-            subprocess.run(
-                ["git", "clone", _NSFW_REPO, "nsfw_pack"],
-                cwd=_DIR, capture_output=True, timeout=60,
-            )
-        if _nsfw_populated():
-            print("[KPPB] NSFW module fetched successfully.")
-        else:
-            print("[KPPB] Warning: NSFW fetch completed but no Python files found.")
-    except Exception as e:
-        print(f"[KPPB] Warning: failed to fetch NSFW module: {e}")
-
-
-def _clean_nsfw():
-    """Remove nsfw_pack contents. Handles both git submodule and direct clone."""
-    try:
-        import shutil
-        if _is_git_repo():
-            subprocess.run(
-                ["git", "submodule", "deinit", "-f", "--", "nsfw_pack"],
-                cwd=_DIR, capture_output=True, timeout=30,
-            )
-        if os.path.isdir(_NSFW_DIR):
-            shutil.rmtree(_NSFW_DIR)
-            os.makedirs(_NSFW_DIR, exist_ok=True)
-        print("[KPPB] NSFW module cleaned up.")
-    except Exception as e:
-        print(f"[KPPB] Warning: failed to clean NSFW module: {e}")
-
+from .config import nsfw_enabled
+from .nsfw_sync import nsfw_populated, sync_in_background
 
 # ── Config-driven NSFW submodule management ──
-_config = _load_config()
-_nsfw_enabled = _config.get("nsfw", False)
-
-if _nsfw_enabled and not _nsfw_populated():
-    print("[KPPB] NSFW enabled in config.json but module not found. Fetching...")
-    _fetch_nsfw()
-elif not _nsfw_enabled and _nsfw_populated():
-    print("[KPPB] NSFW disabled in config.json. Cleaning up module...")
-    _clean_nsfw()
+# Decided before anything is imported, and the sync only starts once every
+# module is loaded, so a fetch or clean can't change nsfw_pack/ under an
+# import (nodes.py makes the same check for the NSFW expansions)
+_nsfw_ready = nsfw_enabled() and nsfw_populated()
 
 # ── Core node imports ──
 from .nodes import KPPBPromptBuilder, KPPBOutfitComposer, KPPBImageEditComposer
@@ -101,13 +21,18 @@ from .list_nodes import (
     KPPBHairstyleList,
     KPPBActionList,
     KPPBGroupActionList,
+    KPPBMultiSelectList,
+    LIST_VOCABULARIES,
+)
+from .batch_nodes import (
+    KPPBPromptBuilderBatch,
+    KPPBSpecIndex,
+    KPPBSpecSampler,
+    KPPBOutfitComposerBatch,
+    KPPBImageEditComposerBatch,
 )
-try:
-    from .vlm_nodes import KPPBVLMRefiner
-    _vlm_available = True
-except ImportError:
-    _vlm_available = False
-    print("[KPPB] Warning: VLM Refiner unavailable (missing numpy/Pillow).")
+from .utility_nodes import KPPBPromptDedupe, KPPBGatherConditioning, KPPBCanonicalPrompt
+from .vlm_nodes import KPPBVLMRefiner
 
 NODE_CLASS_MAPPINGS = {
     "KPPBPromptBuilder": KPPBPromptBuilder,
@@ -124,6 +49,17 @@ NODE_CLASS_MAPPINGS = {
     "KPPBHairstyleList": KPPBHairstyleList,
     "KPPBActionList": KPPBActionList,
     "KPPBGroupActionList": KPPBGroupActionList,
+    "KPPBMultiSelectList": KPPBMultiSelectList,
+    "KPPBPromptBuilderBatch": KPPBPromptBuilderBatch,
+    "KPPBSpecIndex": KPPBSpecIndex,
+    "KPPBSpecSampler": KPPBSpecSampler,
+    "KPPBOutfitComposerBatch": KPPBOutfitComposerBatch,
+    "KPPBImageEditComposerBatch": KPPBImageEditComposerBatch,
+    "KPPBPromptDedupe": KPPBPromptDedupe,
+    "KPPBGatherConditioning": KPPBGatherConditioning,
+    "KPPBCanonicalPrompt": KPPBCanonicalPrompt,
+    # numpy + Pillow are imported on the first refine() call
+    "KPPBVLMRefiner": KPPBVLMRefiner,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -141,15 +77,20 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "KPPBHairstyleList": "Hairstyle List (kppb)",
     "KPPBActionList": "Action List (kppb)",
     "KPPBGroupActionList": "Group Action List (kppb)",
+    "KPPBMultiSelectList": "Multi-Select List (kppb)",
+    "KPPBPromptBuilderBatch": "Prompt Builder Batch (kppb)",
+    "KPPBSpecIndex": "Spec Index (kppb)",
+    "KPPBSpecSampler": "Spec Sampler (kppb)",
+    "KPPBOutfitComposerBatch": "Outfit Composer Batch (kppb)",
+    "KPPBImageEditComposerBatch": "Image Edit Composer Batch (kppb)",
+    "KPPBPromptDedupe": "Prompt Dedupe (kppb)",
+    "KPPBGatherConditioning": "Gather Conditioning (kppb)",
+    "KPPBCanonicalPrompt": "Canonical Prompt (kppb)",
+    "KPPBVLMRefiner": "VLM Prompt Refiner (kppb)",
 }
 
-# ── Optional VLM module (requires numpy + Pillow) ──
-if _vlm_available:
-    NODE_CLASS_MAPPINGS["KPPBVLMRefiner"] = KPPBVLMRefiner
-    NODE_DISPLAY_NAME_MAPPINGS["KPPBVLMRefiner"] = "VLM Prompt Refiner (kppb)"
-
 # ── Optional NSFW module (loaded only when enabled + populated) ──
-if _nsfw_enabled:
+if _nsfw_ready:
     try:
         from .nsfw_pack import (
             KPPBNSFWActionList,
@@ -168,5 +109,18 @@ if _nsfw_enabled:
             "KPPBNSFWGroupActionList": "NSFW Group Action List (kppb)",
             "KPPBNSFWPoseList": "NSFW Pose List (kppb)",
         })
-    except ImportError:
-        print("[KPPB] Warning: NSFW enabled but module failed to load.")
+
+        # Offer the NSFW vocabularies in the Multi-Select List too
+        for _name, _cls in (("nsfw action", KPPBNSFWActionList),
+                            ("nsfw group action", KPPBNSFWGroupActionList),
+                            ("nsfw pose", KPPBNSFWPoseList)):
+            if getattr(_cls, "ITEMS", None):
+                LIST_VOCABULARIES[_name] = _cls.ITEMS
+    except Exception as e:
+        print(f"[KPPB] Warning: NSFW enabled but module failed to load: {e}")
+
+# ── Background NSFW sync ──
+# Started after every import above: git/network work never blocks startup.
+# It runs on a daemon thread with a time budget (or explicitly via
+# `python -m kppb sync`), and its result applies on the next restart
+sync_in_background()
@@ -0,0 +1,450 @@
+"""
+List-native batch nodes for KPPB.
+Take LIST inputs straight from the list nodes and return aligned prompt lists
+in a single execution, instead of one queue item per XY Plot cell.
+"""
+
+import json
+import math
+import random
+from collections.abc import Sequence
+
+from .config import cached_input_types
+from .nodes import (
+    EDIT_TYPES,
+    INCOMPATIBLE_OPTIONS,
+    OUTFIT_SLOTS,
+    PROMPT_SPACE_FIELDS,
+    RANDOM_FIELDS,
+    KPPBOutfitComposer,
+    KPPBPromptBuilder,
+    _compose_single_edit,
+    _edit_tail,
+    _inputs_hash,
+    _pool,
+    _weight_tables,
+    describe_outfit,
+    effect_prose,
+    join_edit,
+    outfit_rules,
+    outfit_spec_space,
+    parse_edit_record,
+    parse_space_fields,
+    prompt_spec_space,
+    section_cache_info,
+)
+from .specs import SpecSampler, SpecSpace, WeightedSpecSampler
+
+
+BATCH_COMBINE_MODES = ["zip", "cartesian"]
+
+# Prompt Builder arguments that can be swept with a LIST input, in the order
+# they are expanded (first axis varies slowest in cartesian mode).
+BATCH_AXES = (
+    "pose",
+    "action",
+    "scene_type",
+    "shot_type",
+    "camera_angle",
+    "lighting_setup",
+    "photo_style",
+    "lens",
+    "depth_of_field",
+    "color_grading",
+    "hairstyle",
+    "hair_color",
+    "outfit",
+    "edit_instructions",
+    "environment",
+)
+
+_BUILDER = KPPBPromptBuilder()
+
+
+def _axis_values(values):
+    """Flatten an INPUT_IS_LIST argument into the values of one axis.
+    A LIST socket arrives wrapped as [[a, b, c]]; OUTPUT_IS_LIST producers
+    arrive already flat as [a, b, c]."""
+    if len(values) == 1 and isinstance(values[0], Sequence) and not isinstance(values[0], str):
+        return list(values[0])
+    return list(values)
+
+
+def _section_totals():
+    stats = section_cache_info().values()
+    return sum(s["hits"] for s in stats), sum(s["misses"] for s in stats)
+
+
+def _zip_axes(axes):
+    """Zip axes of unequal length, repeating the last value of shorter axes
+    (same rule ComfyUI uses when mapping a node over lists)."""
+    n = max(len(a) for a in axes)
+    return (tuple(a[min(i, len(a) - 1)] for a in axes) for i in range(n))
+
+
+def _combine_axes(names, axes, combine):
+    """Yield one {axis: value} dict per cell. Cartesian products skip
+    INCOMPATIBLE_OPTIONS combinations; zip pairs are explicit and kept."""
+    if not axes:
+        return iter([{}])
+    if combine == "cartesian":
+        return SpecSpace(zip(names, axes), INCOMPATIBLE_OPTIONS).iter_range()
+    return (dict(zip(names, combo)) for combo in _zip_axes(axes))
+
+
+# ══════════════════════════════════════════════
+# PROMPT BUILDER (BATCH)
+# ══════════════════════════════════════════════
+
+class KPPBPromptBuilderBatch:
+    """List-native Prompt Builder. Expands LIST inputs (zip or cartesian) and
+    returns aligned positive/negative/JSON lists from one node execution."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        base = KPPBPromptBuilder.INPUT_TYPES()
+        inputs = {
+            "required": {"combine": (BATCH_COMBINE_MODES, {"default": "cartesian"})},
+            "optional": {},
+        }
+        inputs["required"].update(base["required"])
+        inputs["optional"].update(base.get("optional", {}))
+        for axis in BATCH_AXES:
+            inputs["optional"][f"{axis}_list"] = ("LIST", {
+                "tooltip": f"Sweep {axis} over a list (overrides the {axis} widget)"})
+        return inputs
+
+    @classmethod
+    def IS_CHANGED(cls, seed=(-1,), **kwargs):
+        flat = {k: v[0] if len(v) == 1 else v for k, v in kwargs.items() if v}
+        return _inputs_hash(list(seed) or [-1], flat)
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "INT", "KPPB_SPEC", "INT")
+    RETURN_NAMES = ("positive_prompt", "negative_prompt", "prompt_json", "count", "spec", "token_count")
+    OUTPUT_IS_LIST = (True, True, True, False, True, True)
+    FUNCTION = "build_prompt_batch"
+    CATEGORY = "conditioning/klein"
+
+    def build_prompt_batch(self, combine, **kwargs):
+        combine = combine[0]
+
+        # Scalar widgets arrive as one-element lists
+        base = {}
+        for key, values in kwargs.items():
+            if not key.endswith("_list") and values:
+                base[key] = values[0]
+
+        names, axes = [], []
+        for axis in BATCH_AXES:
+            values = _axis_values(kwargs.get(f"{axis}_list") or [])
+            if values:
+                names.append(axis)
+                axes.append(values)
+
+        # Each cell gets its own seed so "random" fields differ between cells
+        seed = base.pop("seed", -1)
+        hits0, misses0 = _section_totals()
+
+        positives, negatives, jsons, specs, tokens = [], [], [], [], []
+        for i, combo in enumerate(_combine_axes(names, axes, combine)):
+            cell = dict(base)
+            cell.update(combo)
+            cell["seed"] = seed + i if seed >= 0 else -1
+            positive, negative, prompt_json, spec, token_count = _BUILDER.build_prompt(**cell)
+            positives.append(positive)
+            negatives.append(negative)
+            jsons.append(prompt_json)
+            specs.append(spec)
+            tokens.append(token_count)
+
+        if combine == "cartesian" and axes:
+            dropped = math.prod(map(len, axes)) - len(positives)
+            if dropped:
+                print(f"[KPPB] Warning: cartesian batch dropped {dropped} of "
+                      f"{dropped + len(positives)} cells with incompatible options (INCOMPATIBLE_OPTIONS)")
+        hits, misses = _section_totals()
+        print(f"[KPPB] Batch built {len(positives)} prompts ({combine}, {len(axes)} axes), "
+              f"section cache {hits - hits0} hits / {misses - misses0} misses")
+        return (positives, negatives, jsons, len(positives), specs, tokens)
+
+
+# ══════════════════════════════════════════════
+# SPEC INDEX (mixed-radix combination decoder)
+# ══════════════════════════════════════════════
+
+class KPPBSpecIndex:
+    """Decode an integer index into one cell of the Prompt Builder combination
+    space (mixed radix over the chosen fields). Wire a counter into `index` to
+    walk a multi-billion-cell sweep without ever listing it."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "subject": ("STRING", {"multiline": True, "default": ""}),
+                "index": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff,
+                                  "tooltip": "Cell index — wraps around the total cardinality"}),
+                "fields": ("STRING", {"default": "pose, scene_type, lighting_setup, shot_type, camera_angle",
+                                      "tooltip": "Comma-separated Prompt Builder fields to sweep (empty = all)"}),
+                "preserve_identity": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "outfit": ("STRING", {"multiline": True, "default": "", "forceInput": True}),
+                "environment": ("STRING", {"multiline": True, "default": ""}),
+                "extra_details": ("STRING", {"multiline": True, "default": ""}),
+                "negative_prompt": ("STRING", {"multiline": True, "default": ""}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "INT", "KPPB_SPEC")
+    RETURN_NAMES = ("positive_prompt", "negative_prompt", "prompt_json", "total", "spec")
+    FUNCTION = "decode"
+    CATEGORY = "conditioning/klein"
+
+    def decode(self, subject, index, fields, preserve_identity=True, **kwargs):
+        space = prompt_spec_space(parse_space_fields(fields))
+        if not space.size:
+            raise ValueError(f"Spec Index: no valid spec — incompatible options leave nothing "
+                             f"to combine between {', '.join(space.conflicting_fields())}")
+        cell = dict.fromkeys(PROMPT_SPACE_FIELDS, "unset")
+        cell.update(space.decode(index % space.size))
+        positive, negative, prompt_json, spec, _ = _BUILDER.build_prompt(
+            subject=subject, preserve_identity=preserve_identity, **cell, **kwargs)
+        return (positive, negative, prompt_json, space.size, spec)
+
+
+# ══════════════════════════════════════════════
+# SPEC SAMPLER (unique, evenly spread specs)
+# ══════════════════════════════════════════════
+
+class KPPBSpecSampler:
+    """Draw `count` unique specs from the Prompt Builder combination space with
+    low-discrepancy coverage — every option of every swept field shows up
+    evenly and no spec repeats. Same seed + start gives the same samples."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "subject": ("STRING", {"multiline": True, "default": ""}),
+                "count": ("INT", {"default": 100, "min": 1, "max": 1000000}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 2147483647}),
+                "fields": ("STRING", {"default": "pose, scene_type, lighting_setup, shot_type, camera_angle",
+                                      "tooltip": "Comma-separated Prompt Builder fields to sample (empty = all)"}),
+                "preserve_identity": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "start": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff,
+                                  "tooltip": "Offset into the sample stream — page through it in chunks"}),
+                "outfit": ("STRING", {"multiline": True, "default": "", "forceInput": True}),
+                "environment": ("STRING", {"multiline": True, "default": ""}),
+                "extra_details": ("STRING", {"multiline": True, "default": ""}),
+                "negative_prompt": ("STRING", {"multiline": True, "default": ""}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "INT", "KPPB_SPEC")
+    RETURN_NAMES = ("positive_prompt", "negative_prompt", "prompt_json", "count", "spec")
+    OUTPUT_IS_LIST = (True, True, True, False, True)
+    FUNCTION = "sample"
+    CATEGORY = "conditioning/klein"
+
+    def sample(self, subject, count, seed, fields, preserve_identity=True, start=0, **kwargs):
+        sampler = SpecSampler(prompt_spec_space(parse_space_fields(fields)), seed)
+        if start + count > len(sampler):
+            print(f"[KPPB] Spec sampler: only {len(sampler)} unique specs, "
+                  f"returning {max(0, len(sampler) - start)}")
+
+        base = dict.fromkeys(PROMPT_SPACE_FIELDS, "unset")
+        positives, negatives, jsons, specs = [], [], [], []
+        for sample in sampler.iter_range(start, start + count):
+            cell = dict(base)
+            cell.update(sample)
+            positive, negative, prompt_json, spec, _ = _BUILDER.build_prompt(
+                subject=subject, preserve_identity=preserve_identity, **cell, **kwargs)
+            positives.append(positive)
+            negatives.append(negative)
+            jsons.append(prompt_json)
+            specs.append(spec)
+        return (positives, negatives, jsons, len(positives), specs)
+
+
+# ══════════════════════════════════════════════
+# OUTFIT COMPOSER (BATCH)
+# ══════════════════════════════════════════════
+
+def _unique_outfits(slots, varying, count, seed, weights, extra, color_harmony=False):
+    """Up to `count` distinct outfit strings, all of them compatible outfits,
+    plus the number of compatible combinations of the random slots. Uniform
+    slots walk a SpecSampler over the constrained outfit space (unique,
+    evenly spread); with weights, a WeightedSpecSampler draws distinct
+    combinations in proportion to their weights. Both build each combination
+    from the valid-completion counts, so no incompatible outfit is drawn."""
+    locked = {slot: value for slot, value in slots.items() if slot not in varying}
+    rules = outfit_rules(color_harmony)
+    axes = []
+    for slot in varying:
+        options = (weights.get(slot) or _pool(RANDOM_FIELDS[slot])).options
+        allowed = rules.allowed(slot, locked)
+        options = options if allowed is None else tuple(o for o in options if o in allowed)
+        if not options:
+            raise ValueError(f"Outfit batch: no '{slot}' option goes with the locked slots "
+                             f"({', '.join(f'{k}={v}' for k, v in locked.items() if v not in ('unset', 'none'))})")
+        axes.append((slot, options))
+    space = outfit_spec_space(tuple(axes), color_harmony)
+    if not space.size:
+        raise ValueError(f"Outfit batch: no compatible outfit — conflicting slots: "
+                         f"{', '.join(space.conflicting_fields())}")
+
+    if any(slot in weights for slot in varying):
+        table_weights = {slot: weights[slot].weights for slot in varying if slot in weights}
+        combos = WeightedSpecSampler(space, table_weights, random.Random(f"kppb-outfits:{seed}"))
+    else:
+        combos = SpecSampler(space, seed).iter_range()
+    # Distinct combinations can still read the same (e.g. one accessory twice)
+    seen = {}
+    for combo in combos:
+        seen.setdefault(describe_outfit(**dict(slots, **combo), extra_outfit_details=extra), None)
+        if len(seen) == count:
+            break
+    return list(seen), space.size
+
+
+class KPPBOutfitComposerBatch:
+    """Outfit Composer that returns `count` distinct outfits in one run.
+    Slots set to "random" vary between outfits; every other slot stays locked
+    (e.g. fixed shoes). Outputs LIST + count for the batch/XY nodes."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        base = KPPBOutfitComposer.INPUT_TYPES()
+        inputs = {
+            "required": {"count": ("INT", {"default": 100, "min": 1, "max": 100000,
+                                           "tooltip": "Number of distinct outfits to compose"})},
+            "optional": dict(base.get("optional", {})),
+        }
+        inputs["required"].update(base["required"])
+        return inputs
+
+    @classmethod
+    def IS_CHANGED(cls, seed=-1, **kwargs):
+        return _inputs_hash(seed, kwargs)
+
+    RETURN_TYPES = ("LIST", "INT")
+    RETURN_NAMES = ("outfits", "count")
+    FUNCTION = "compose_batch"
+    CATEGORY = "conditioning/klein"
+
+    def compose_batch(self, count, seed=-1, random_weights="", extra_outfit_details="",
+                      color_harmony=False, **kwargs):
+        slots = {slot: kwargs.get(slot, "unset") for slot in OUTFIT_SLOTS}
+        varying = tuple(slot for slot in OUTFIT_SLOTS if slots[slot] == "random")
+        if not varying:
+            outfit = describe_outfit(**slots, extra_outfit_details=extra_outfit_details)
+            print("[KPPB] Outfit batch: no slot is set to random, returning 1 outfit")
+            return ([outfit], 1)
+
+        if seed < 0:
+            seed = random.randrange(2147483648)
+        outfits, combinations = _unique_outfits(
+            slots, varying, count, seed, _weight_tables(random_weights), extra_outfit_details,
+            color_harmony)
+        if len(outfits) < count:
+            print(f"[KPPB] Warning: outfit batch asked for {count} outfits, only {len(outfits)} "
+                  f"distinct ones exist ({combinations} compatible combinations of "
+                  f"{len(varying)} random slots)")
+        return (outfits, len(outfits))
+
+
+# ══════════════════════════════════════════════
+# IMAGE EDIT COMPOSER (BATCH)
+# ══════════════════════════════════════════════
+
+EDIT_BATCH_MODES = ["each", "stacked"]
+
+
+def _edit_records(edits, edits_json):
+    """Edit records from a LIST input plus a JSON array, in that order."""
+    records = list(edits)
+    if edits_json and edits_json.strip():
+        try:
+            extra = json.loads(edits_json)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"edits_json is not valid JSON: {e}") from e
+        records.extend(extra if isinstance(extra, list) else [extra])
+    return [parse_edit_record(r) for r in records]
+
+
+class KPPBImageEditComposerBatch:
+    """Image Edit Composer over any number of edit records and IG quick
+    effects. Each record and effect is composed once, then every
+    combination is joined into its own edit prompt in one run."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "edit_mode": (EDIT_BATCH_MODES, {"default": "each",
+                                                 "tooltip": "each: one prompt per edit x effect. stacked: all edits in every prompt, one prompt per effect"}),
+                "preserve_identity": ("BOOLEAN", {"default": True,
+                                                  "tooltip": "Append identity lock to prevent face/likeness drift during edits"}),
+            },
+            "optional": {
+                "edits": ("LIST", {"tooltip": "Edit records ({type, target, value, location} or plain text), e.g. from Image Edit List"}),
+                "edits_json": ("STRING", {"multiline": True, "default": "",
+                                          "placeholder": '[{"type": "replace element", "target": "the jacket", "value": "leather bomber"}]',
+                                          "tooltip": f"More edit records as a JSON array. Types: {', '.join(EDIT_TYPES)}"}),
+                "effects": ("LIST", {"tooltip": "IG quick effects (names like 'add rain' or prose), e.g. from IG Effect List"}),
+                "preserve_note": ("STRING", {"multiline": True, "default": "",
+                                             "placeholder": "what to keep unchanged (e.g. keep the pose and expression)"}),
+            },
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("STRING", "STRING", "INT")
+    RETURN_NAMES = ("edit_prompt", "edit_json", "count")
+    OUTPUT_IS_LIST = (True, True, False)
+    FUNCTION = "compose_edit_batch"
+    CATEGORY = "conditioning/klein"
+
+    def compose_edit_batch(self, edit_mode, preserve_identity, edits=(), edits_json=("",),
+                           effects=(), preserve_note=("",)):
+        edit_mode = edit_mode[0]
+        records = _edit_records(_axis_values(edits), edits_json[0])
+        effects = _axis_values(effects) or ["none"]
+
+        # Compose every record and effect once; combinations only join strings
+        composed = [(r, _compose_single_edit(r["type"], r["target"], r["value"], r["location"]))
+                    for r in records]
+        skipped = sum(1 for _, text in composed if not text)
+        composed = [(r, text) for r, text in composed if text]
+        if skipped:
+            print(f"[KPPB] Edit batch: skipped {skipped} empty edit records")
+        groups = [[c] for c in composed] if edit_mode == "each" else [composed]
+        groups = groups or [[]]
+        effects = [(effect, effect_prose(effect)) for effect in effects]
+        tail = _edit_tail(preserve_identity[0], preserve_note[0])
+
+        prompts, jsons = [], []
+        for group in groups:
+            head = [text for _, text in group]
+            for effect, prose in effects:
+                edit_prompt = join_edit(head + ([prose] if prose else []) + tail)
+                prompts.append(edit_prompt)
+                jsons.append(json.dumps({
+                    "edits": [r for r, _ in group],
+                    "ig_quick_effect": effect,
+                    "preserve_identity": preserve_identity[0],
+                    "preserve_note": preserve_note[0],
+                    "composed_prompt": edit_prompt,
+                }, indent=2))
+
+        print(f"[KPPB] Edit batch: {len(prompts)} edit prompts "
+              f"({len(groups)} edit sets x {len(effects)} effects, {edit_mode})")
+        return (prompts, jsons, len(prompts))
@@ -0,0 +1,61 @@
+"""
+Shared config.json loader.
+The parsed config is cached by the file's mtime and size, so callers can ask
+for it on every use and still see edits without a restart. INPUT_TYPES
+schemas are memoized per node class against the same stamp.
+"""
+
+import functools
+import json
+import os
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(_DIR, "config.json")
+DEFAULT_CONFIG = {"nsfw": False, "auto_sync": True, "sync_timeout": 60}
+
+_cache = {"stamp": None, "config": None}
+
+
+def config_stamp():
+    """(mtime_ns, size) of config.json, or None when it doesn't exist."""
+    try:
+        st = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_config():
+    """config.json merged over DEFAULT_CONFIG; defaults if missing or malformed.
+    Re-read only when the file changes."""
+    stamp = config_stamp()
+    if _cache["config"] is None or _cache["stamp"] != stamp:
+        config = dict(DEFAULT_CONFIG)
+        try:
+            with open(CONFIG_PATH, "r") as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                config.update(loaded)
+        except (OSError, json.JSONDecodeError):
+            pass
+        _cache["stamp"], _cache["config"] = stamp, config
+    return _cache["config"]
+
+
+def nsfw_enabled():
+    return bool(load_config().get("nsfw", False))
+
+
+def cached_input_types(build):
+    """Memoize an INPUT_TYPES builder per node class; rebuilt when config.json
+    changes. Use under @classmethod. Callers must not mutate the result."""
+    cache = {}
+
+    @functools.wraps(build)
+    def input_types(cls):
+        stamp = config_stamp()
+        hit = cache.get(cls)
+        if hit is None or hit[0] != stamp:
+            hit = cache[cls] = (stamp, build(cls))
+        return hit[1]
+    return input_types
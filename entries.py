@@ -0,0 +1,98 @@
+"""
+File-backed custom entries for list nodes.
+A .txt (one entry per line), .csv (first column, or an entry/value/text/name
+column) or .jsonl (strings or objects with one of those keys) file is parsed
+in one streaming pass into its unique, non-empty entries. The result is
+cached by path, mtime and size, so an unchanged file is never read again.
+Files must live in ComfyUI's input directory.
+"""
+
+import csv
+import json
+import os
+
+ENTRY_KEYS = ("entry", "value", "text", "name")
+
+# abs path -> (mtime_ns, size, tuple of entries)
+_CACHE = {}
+
+
+def entries_root():
+    """ComfyUI's input directory (the working directory outside ComfyUI)."""
+    try:
+        import folder_paths
+        return os.path.realpath(folder_paths.get_input_directory())
+    except ImportError:
+        return os.path.realpath(os.getcwd())
+
+
+def resolve_entries_path(path):
+    """Resolve a custom_entries_file against the input directory. Paths that
+    end up outside it (absolute, ~, .. or symlinks) are rejected, so a
+    workflow can't read arbitrary files from the server."""
+    root = entries_root()
+    resolved = os.path.realpath(os.path.join(root, path.strip()))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"custom_entries_file must be inside the ComfyUI input folder ({root}): {path.strip()!r}")
+    return resolved
+
+
+def _csv_entries(f, path):
+    """Entries of a CSV file: the entry/value/text/name column when the
+    header row names one, else the first column of every row."""
+    reader = csv.reader(f)
+    try:
+        first = next(reader, [])
+        header = [c.strip().lower() for c in first]
+        column = next((header.index(k) for k in ENTRY_KEYS if k in header), None)
+        if column is None:
+            column = 0
+            yield first[0].strip() if first else ""
+        for row in reader:
+            yield row[column].strip() if len(row) > column else ""
+    except csv.Error as e:
+        raise ValueError(f"{path}: invalid CSV: {e}") from e
+
+
+def _jsonl_entries(f, path):
+    """Entries of a JSONL file: string values, or objects' first ENTRY_KEYS key."""
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: invalid JSON line: {e}") from e
+        if isinstance(value, dict):
+            value = next((value[k] for k in ENTRY_KEYS if k in value), "")
+        yield str(value).strip() if value is not None else ""
+
+
+def _read_entries(path):
+    """Unique, non-empty entries of a file, in first-seen order."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if ext == ".csv":
+            entries = _csv_entries(f, path)
+        elif ext in (".jsonl", ".ndjson"):
+            entries = _jsonl_entries(f, path)
+        else:
+            entries = (line.strip() for line in f)
+        return tuple(dict.fromkeys(e for e in entries if e))
+
+
+def load_entries(path):
+    """Entries of a custom_entries_file as a new list; the file is parsed
+    again only when its mtime or size change."""
+    path = resolve_entries_path(path)
+    try:
+        st = os.stat(path)
+        cached = _CACHE.get(path)
+        if not (cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size):
+            cached = (st.st_mtime_ns, st.st_size, _read_entries(path))
+            _CACHE[path] = cached
+            print(f"[KPPB] Indexed {len(cached[2])} unique entries from {os.path.basename(path)}")
+    except OSError as e:
+        raise ValueError(f"custom_entries_file not readable: {e}") from e
+    return list(cached[2])
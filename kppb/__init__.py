@@ -0,0 +1,26 @@
+"""
+Headless entry points for KPPB (python -m kppb).
+The node modules use package-relative imports, but the node pack's own
+__init__.py registers ComfyUI nodes and starts the NSFW module sync, so it
+must not run outside ComfyUI. core() loads the repo-root modules under a synthetic
+package that points at the same directory instead.
+"""
+
+import importlib
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CORE = "_kppb_core"
+
+
+def core(name):
+    """Import a repo-root module (e.g. "nodes") without running the node
+    pack's __init__.py."""
+    if _CORE not in sys.modules:
+        pkg = types.ModuleType(_CORE)
+        pkg.__path__ = [ROOT]
+        pkg.__package__ = _CORE
+        sys.modules[_CORE] = pkg
+    return importlib.import_module(f"{_CORE}.{name}")
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# Guarded: process-pool workers re-import this module
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Startup and /object_info cost benchmark for the node pack.
+
+    python -m kppb bench -o bench.json
+    python -m kppb bench --check      # exit 1 if an import loads numpy/PIL
+
+Every import is measured cold in a fresh interpreter with -X importtime: the
+whole pack the way ComfyUI loads it (__init__.py), and nodes / list_nodes /
+vlm_nodes on their own. The pack's nodes are then loaded in-process to size
+their /object_info entries and time INPUT_TYPES. The report is plain JSON
+with sorted keys, so two releases diff cleanly.
+"""
+
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from . import ROOT
+
+REPORT_VERSION = 1
+PACK_NAME = "kppb_bench_pack"
+IMPORT_TARGETS = ("__init__", "nodes", "list_nodes", "vlm_nodes")
+# Must stay out of the import path; vlm_nodes loads them on first use
+HEAVY_MODULES = ("numpy", "PIL")
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+_MARKER = "[KPPB] bench: timing starts"
+
+# Runs in a child interpreter: import one target, print wall time as JSON
+_CHILD = r"""
+import importlib.util, json, os, sys, time
+root, target, pack, MARKER, heavy = sys.argv[1:6]
+sys.path.insert(0, root)
+error = None
+sys.stderr.write(MARKER + "\n")
+t0 = time.perf_counter()
+try:
+    if target == "__init__":
+        spec = importlib.util.spec_from_file_location(
+            pack, os.path.join(root, "__init__.py"), submodule_search_locations=[root])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[pack] = module
+        spec.loader.exec_module(module)
+    else:
+        import kppb
+        sys.stderr.write(MARKER + "\n")
+        t0 = time.perf_counter()
+        kppb.core(target)
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+seconds = time.perf_counter() - t0
+print(json.dumps({"seconds": seconds, "error": error,
+                  "modules": sorted({m.split(".")[0] for m in sys.modules} & set(heavy.split(",")))}))
+"""
+
+
+def load_pack(name=PACK_NAME):
+    """Import the node pack from ROOT the way ComfyUI does (runs __init__.py)."""
+    import importlib.util
+
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _parse_importtime(stderr, top=10):
+    """-X importtime lines after the last timing marker -> (cumulative µs of
+    the top-level imports, heaviest modules by cumulative µs)."""
+    rows = []
+    for line in stderr.split(_MARKER)[-1].splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            self_us, cumulative_us, indent, module = m.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    total = sum(cum for _, _, cum, depth in rows if depth == 0)
+    heaviest = sorted(rows, key=lambda r: -r[2])[:top]
+    return total, [{"module": m, "self_us": s, "cumulative_us": c} for m, s, c, _ in heaviest]
+
+
+def measure_import(target, repeat=3):
+    """Cold import of one target in fresh interpreters; median wall time."""
+    runs = []
+    for _ in range(max(1, repeat)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _CHILD, ROOT, target, PACK_NAME, _MARKER,
+             ",".join(HEAVY_MODULES)],
+            capture_output=True, text=True, cwd=ROOT)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if proc.returncode or not lines:
+            return {"error": (proc.stderr.strip().splitlines() or ["no output"])[-1]}
+        result = json.loads(lines[-1])
+        result["importtime_us"], result["heaviest"] = _parse_importtime(proc.stderr)
+        runs.append(result)
+    report = runs[len(runs) // 2]
+    report["seconds"] = statistics.median(r["seconds"] for r in runs)
+    report["heavy_modules_loaded"] = report.pop("modules")
+    if report["error"] is None:
+        del report["error"]
+    return report
+
+
+def node_info(name, cls, display_name=""):
+    """The /object_info entry ComfyUI builds for one node class."""
+    inputs = cls.INPUT_TYPES()
+    outputs = getattr(cls, "RETURN_TYPES", ())
+    return {
+        "input": inputs,
+        "input_order": {kind: list(values) for kind, values in inputs.items()},
+        "output": outputs,
+        "output_is_list": getattr(cls, "OUTPUT_IS_LIST", [False] * len(outputs)),
+        "output_name": getattr(cls, "RETURN_NAMES", outputs),
+        "name": name,
+        "display_name": display_name or name,
+        "description": getattr(cls, "DESCRIPTION", ""),
+        "category": getattr(cls, "CATEGORY", "sd"),
+        "output_node": getattr(cls, "OUTPUT_NODE", False),
+    }
+
+
+def measure_nodes(pack, calls=200):
+    """Per-node /object_info size and INPUT_TYPES latency (first call and
+    warm median, µs)."""
+    nodes = {}
+    total = 0
+    for name, cls in sorted(pack.NODE_CLASS_MAPPINGS.items()):
+        t0 = time.perf_counter()
+        cls.INPUT_TYPES()
+        first_us = (time.perf_counter() - t0) * 1e6
+        samples = []
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            cls.INPUT_TYPES()
+            samples.append(time.perf_counter() - t0)
+        info = node_info(name, cls, pack.NODE_DISPLAY_NAME_MAPPINGS.get(name, ""))
+        size = len(json.dumps(info).encode("utf-8"))
+        total += size
+        nodes[name] = {
+            "object_info_bytes": size,
+            "inputs": sum(len(v) for v in info["input"].values()),
+            "input_types_first_us": round(first_us, 1),
+            "input_types_us": round(statistics.median(samples) * 1e6, 2),
+        }
+    return {"count": len(nodes), "object_info_bytes": total, "nodes": nodes}
+
+
+def _git_revision():
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=ROOT, timeout=5)
+        return proc.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _pack_version():
+    try:
+        with open(os.path.join(ROOT, "pyproject.toml"), "r", encoding="utf-8") as f:
+            m = re.search(r'^version\s*=\s*"([^"]+)"', f.read(), re.MULTILINE)
+        return m.group(1) if m else None
+    except OSError:
+        return None
+
+
+def run_bench(repeat=3, calls=200, stream=None):
+    """Full benchmark report as a dict."""
+    stream = stream or sys.stderr
+    imports = {}
+    for target in IMPORT_TARGETS:
+        print(f"[KPPB] bench: importing {target} x{repeat}", file=stream, flush=True)
+        imports[target] = measure_import(target, repeat)
+
+    print("[KPPB] bench: measuring INPUT_TYPES / object_info", file=stream, flush=True)
+    pack = load_pack()
+    return {
+        "version": REPORT_VERSION,
+        "pack_version": _pack_version(),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "imports": imports,
+        "object_info": measure_nodes(pack, calls),
+    }
+
+
+def check_report(report):
+    """Import regressions in a report: failed imports and imports that pulled
+    in HEAVY_MODULES. Empty when the import path is clean."""
+    problems = []
+    for target, result in sorted(report["imports"].items()):
+        if result.get("error"):
+            problems.append(f"import {target} failed: {result['error']}")
+        if result.get("heavy_modules_loaded"):
+            problems.append(f"import {target} loaded {', '.join(result['heavy_modules_loaded'])}")
+    return problems
+
+
+def write_report(report, path):
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    if not path or path == "-":
+        sys.stdout.write(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,230 @@
+"""
+Command line interface: python -m kppb <command>.
+
+    python -m kppb build plan.json -o prompts.jsonl
+    python -m kppb build plan.json -o manifest_dir --workers 32
+    python -m kppb build plan.json -o prompts.kppbm --format compact
+    python -m kppb render prompts.kppbm --start 1000 --stop 1010
+    python -m kppb bench -o bench.json
+    python -m kppb sync [--timeout 60 | --status]
+
+Only the prompt core is imported — no ComfyUI, numpy or Pillow (bench loads
+the whole pack on purpose). sync is the only command that runs git.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+class Progress:
+    """Throughput reporter on stderr, at most one line per `interval` seconds."""
+
+    def __init__(self, total, interval=2.0, stream=None):
+        self.total = total
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.count = 0
+        self.t0 = self._last = time.perf_counter()
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if self.interval > 0 and now - self._last >= self.interval:
+            self._last = now
+            self._report(now, f"{self.count}/{self.total}")
+
+    def done(self, target):
+        self._report(time.perf_counter(), f"Wrote {self.count} prompts to {target}")
+
+    def _report(self, now, head):
+        elapsed = now - self.t0
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        print(f"[KPPB] {head} in {elapsed:.1f}s ({rate:,.0f} prompts/s)", file=self.stream, flush=True)
+
+
+def _open_output(path):
+    if not path or path == "-":
+        return sys.stdout, False
+    return open(path, "w", encoding="utf-8", buffering=1 << 20), True
+
+
+def _read_plan_data(path):
+    import json
+
+    try:
+        if path == "-":
+            return json.load(sys.stdin)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Plan {path} is not valid JSON: {e}") from e
+
+
+def cmd_build(args):
+    if args.format == "compact":
+        return _build_compact(args)
+    if args.workers or args.shards:
+        return _build_sharded(args)
+
+    from .plan import load_plan
+
+    plan = load_plan(args.plan)
+    stop = len(plan) if args.limit is None else min(args.limit, len(plan))
+    print(f"[KPPB] {plan.mode} plan: {len(plan)} prompts, writing {stop}", file=sys.stderr)
+    return _write_jsonl(plan.iter_prompts(0, stop), stop, args)
+
+
+def cmd_render(args):
+    from .compact import CompactManifest
+
+    manifest = CompactManifest(args.manifest)
+    stop = len(manifest) if args.stop is None else min(args.stop, len(manifest))
+    start = min(args.start, stop)
+    return _write_jsonl(manifest.iter_prompts(start, stop), stop - start, args)
+
+
+def _write_jsonl(records, total, args):
+    from .plan import prompt_record
+
+    out, owned = _open_output(args.output)
+    progress = Progress(total, args.progress)
+    try:
+        write = out.write
+        for record in records:
+            write(prompt_record(*record))
+            write("\n")
+            progress.update()
+        out.flush()
+    except BrokenPipeError:
+        # Downstream closed early (e.g. `| head`) — not an error
+        if not owned:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        if owned:
+            out.close()
+    progress.done(args.output or "stdout")
+    return 0
+
+
+def _build_compact(args):
+    # numpy is only needed (and imported) for the compact format
+    from .compact import write_compact
+
+    if not args.output or args.output == "-":
+        raise ValueError("Compact builds need -o <file.kppbm>")
+    write_compact(_read_plan_data(args.plan), args.output, workers=args.workers, limit=args.limit)
+    return 0
+
+
+def _build_sharded(args):
+    from .manifest import build_sharded, merge_shards
+
+    if not args.output or args.output == "-":
+        raise ValueError("Sharded builds need -o <directory>")
+    plan_data = _read_plan_data(args.plan)
+    t0 = time.perf_counter()
+    manifest = build_sharded(plan_data, args.output, workers=args.workers,
+                             shards=args.shards, limit=args.limit)
+    elapsed = time.perf_counter() - t0
+    print(f"[KPPB] Wrote {manifest['count']} prompts in {len(manifest['shards'])} shards to "
+          f"{args.output} in {elapsed:.1f}s ({manifest['count'] / max(elapsed, 1e-9):,.0f} prompts/s)",
+          file=sys.stderr)
+    if args.merge:
+        merge_shards(args.output, args.merge)
+        print(f"[KPPB] Merged shards into {args.merge}", file=sys.stderr)
+    return 0
+
+
+def cmd_bench(args):
+    from .bench import check_report, run_bench, write_report
+
+    report = run_bench(repeat=args.repeat, calls=args.calls)
+    if args.output or not args.check:
+        write_report(report, args.output)
+    info = report["object_info"]
+    print(f"[KPPB] bench: {info['count']} nodes, object_info {info['object_info_bytes']:,} bytes, "
+          f"pack import {report['imports']['__init__'].get('seconds', float('nan')) * 1000:.0f} ms",
+          file=sys.stderr)
+    if args.check:
+        problems = check_report(report)
+        for problem in problems:
+            print(f"[KPPB] bench check FAILED: {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print("[KPPB] bench check passed: no import loads numpy/Pillow", file=sys.stderr)
+    return 0
+
+
+def cmd_sync(args):
+    import json
+
+    from . import core
+
+    nsfw_sync = core("nsfw_sync")
+    if args.status:
+        status = nsfw_sync.read_status()
+        print(json.dumps(status, indent=2, sort_keys=True) if status else "No sync has run yet.")
+        return 0
+    action = nsfw_sync.sync_action()
+    if action:
+        print(f"[KPPB] sync: running NSFW {action}...", file=sys.stderr)
+    status = nsfw_sync.sync(timeout=args.timeout)
+    print(f"[KPPB] sync {status['state']}: {status['message']} ({status['seconds']:g}s)", file=sys.stderr)
+    return 0 if status["state"] == "ok" else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m kppb", description="Headless KPPB prompt tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Stream a grid or sampler plan to JSONL")
+    build.add_argument("plan", help="Plan JSON file (- for stdin)")
+    build.add_argument("-o", "--output", help="Output .jsonl path (default: stdout)")
+    build.add_argument("--limit", type=int, help="Write at most this many prompts")
+    build.add_argument("--progress", type=float, default=2.0,
+                       help="Seconds between throughput reports on stderr (0 = final only)")
+    build.add_argument("--workers", type=int,
+                       help="Render in N processes; -o is then a directory of shards + manifest.json")
+    build.add_argument("--shards", type=int,
+                       help="Number of shard files (default: 4 per worker)")
+    build.add_argument("--merge", metavar="PATH",
+                       help="After a sharded build, concatenate the shards into one JSONL")
+    build.add_argument("--format", choices=("jsonl", "compact"), default="jsonl",
+                       help="compact: categorical codes in one memory-mappable .kppbm file (needs numpy)")
+    build.set_defaults(func=cmd_build)
+
+    render = commands.add_parser("render", help="Render prompts from a compact .kppbm manifest to JSONL")
+    render.add_argument("manifest", help="Compact manifest (.kppbm)")
+    render.add_argument("-o", "--output", help="Output .jsonl path (default: stdout)")
+    render.add_argument("--start", type=int, default=0, help="First row")
+    render.add_argument("--stop", type=int, help="Stop before this row (default: all)")
+    render.add_argument("--progress", type=float, default=2.0,
+                        help="Seconds between throughput reports on stderr (0 = final only)")
+    render.set_defaults(func=cmd_render)
+
+    bench = commands.add_parser("bench", help="Measure import time, /object_info size and INPUT_TYPES latency")
+    bench.add_argument("-o", "--output", help="JSON report path (default: stdout)")
+    bench.add_argument("--repeat", type=int, default=3, help="Cold imports per module (median is reported)")
+    bench.add_argument("--calls", type=int, default=200, help="Warm INPUT_TYPES calls per node")
+    bench.add_argument("--check", action="store_true",
+                       help="Exit 1 if an import fails or loads numpy/Pillow (report written only with -o)")
+    bench.set_defaults(func=cmd_bench)
+
+    sync = commands.add_parser("sync", help="Fetch or clean the NSFW module to match config.json")
+    sync.add_argument("--timeout", type=float,
+                      help="Time budget in seconds (default: config.json sync_timeout, 60)")
+    sync.add_argument("--status", action="store_true", help="Print the last sync status and exit")
+    sync.set_defaults(func=cmd_sync)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"[KPPB] Error: {e}", file=sys.stderr)
+        return 2
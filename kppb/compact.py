@@ -0,0 +1,229 @@
+"""
+Compact categorical-coded manifests (.kppbm).
+Each row stores one small integer code per varying field (uint8, or uint16
+for vocabularies over 256 options); fixed arguments and the vocabularies live
+in a JSON header. The rows are a numpy structured array read through
+np.memmap, so slicing or filtering a 50M-row manifest needs no parsing and
+prompts are rendered only when asked for.
+
+Layout: 8-byte magic, uint32 little-endian header length, UTF-8 JSON header,
+zero padding to a 64-byte boundary, then `rows` packed records.
+"""
+
+import json
+import multiprocessing
+import struct
+import sys
+import time
+
+import numpy as np
+
+from . import core
+from .manifest import shard_ranges
+from .plan import BuildPlan
+
+_nodes = core("nodes")
+
+MAGIC = b"KPPBCM\x00\x01"
+COMPACT_VERSION = 1
+_ALIGN = 64
+_CHUNK = 1 << 16
+
+
+def _code_dtype(n):
+    if n <= 1 << 8:
+        return "u1"
+    if n <= 1 << 16:
+        return "u2"
+    return "u4"
+
+
+def _columns(plan):
+    """(field, vocab) for every field that can vary between rows: the plan's
+    axes plus base fields left as "random"."""
+    columns = []
+    for field, values in zip(plan.space.fields, plan.space.values):
+        vocab = list(dict.fromkeys(values))
+        if "random" in vocab:
+            vocab += [v for v in _nodes.RANDOM_FIELDS[field] if v not in vocab]
+        columns.append((field, vocab))
+    for field, value in plan.base.items():
+        if value == "random" and field in _nodes.RANDOM_FIELDS:
+            columns.append((field, list(_nodes.RANDOM_FIELDS[field])))
+    return columns
+
+
+def _input_value(field, value):
+    """Spec value -> builder input (specs store an unset dropdown as "")."""
+    if value == "" and field in _nodes.RANDOM_FIELDS:
+        return "unset"
+    return value
+
+
+def _header_bytes(header):
+    body = json.dumps(header).encode("utf-8")
+    offset = len(MAGIC) + 4 + len(body)
+    offset += -offset % _ALIGN
+    return MAGIC + struct.pack("<I", len(body)) + body, offset
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compact KPPB manifest")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+    offset = len(MAGIC) + 4 + length
+    return header, offset + (-offset % _ALIGN)
+
+
+def _dtype(header):
+    return np.dtype([(c["field"], c["dtype"]) for c in header["columns"]])
+
+
+def _fill_rows(task):
+    """Worker: encode plan indices [start, stop) into the preallocated file."""
+    plan_data, path, start, stop = task
+    plan = BuildPlan(plan_data)
+    header, offset = _read_header(path)
+    rows = np.memmap(path, dtype=_dtype(header), mode="r+", offset=offset, shape=(header["rows"],))
+    fields = [c["field"] for c in header["columns"]]
+    lookups = [{v: i for i, v in enumerate(c["vocab"])} for c in header["columns"]]
+
+    # Without "random" values the plan cells are the row values; otherwise
+    # the values are only known after the builder resolves them
+    if header["rendered"]:
+        def values():
+            for _, _, _, spec in plan.iter_prompts(start, stop):
+                yield tuple(_input_value(f, spec.get(f)) for f in fields)
+    else:
+        def values():
+            for _, cell in plan.iter_specs(start, stop):
+                yield tuple(cell[f] for f in fields)
+
+    pos = start
+    chunk = []
+    for row in values():
+        chunk.append(tuple(lookup[v] for lookup, v in zip(lookups, row)))
+        if len(chunk) == _CHUNK:
+            rows[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+            chunk = []
+    if chunk:
+        rows[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    rows.flush()
+    return pos - start
+
+
+def write_compact(plan_data, path, workers=1, limit=None, stream=None):
+    """Encode a plan into a .kppbm file. Rows are preallocated, so workers
+    fill disjoint index ranges of the same file in parallel. Returns the
+    row count."""
+    stream = stream or sys.stderr
+    plan = BuildPlan(plan_data)
+    size = len(plan) if limit is None else min(limit, len(plan))
+    columns = _columns(plan)
+    fixed = {k: v for k, v in plan.base.items() if k not in dict(columns) and k != "random_weights"}
+    header = {
+        "version": COMPACT_VERSION,
+        "rows": size,
+        "columns": [{"field": f, "dtype": _code_dtype(len(v)), "vocab": v} for f, v in columns],
+        "base": fixed,
+        "rendered": any("random" in v for v in plan.space.values) or len(columns) > len(plan.space.fields),
+        "plan": plan_data,
+    }
+    if header["rendered"] and not plan.deterministic:
+        print("[KPPB] Warning: plan uses 'random' without a seed — codes will differ between runs",
+              file=stream)
+    head, offset = _header_bytes(header)
+    itemsize = _dtype(header).itemsize
+    with open(path, "wb") as f:
+        f.write(head)
+        f.write(b"\0" * (offset - len(head)))
+        f.truncate(offset + size * itemsize)
+
+    print(f"[KPPB] {plan.mode} plan: {size} rows x {itemsize} bytes "
+          f"({(offset + size * itemsize) / 1e6:,.1f} MB)", file=stream, flush=True)
+    t0 = time.perf_counter()
+    workers = max(1, workers or 1)
+    tasks = [(plan_data, path, start, stop)
+             for start, stop in shard_ranges(size, workers * 4 if workers > 1 else 1) if stop > start]
+    if workers == 1:
+        written = sum(map(_fill_rows, tasks))
+    else:
+        with multiprocessing.get_context().Pool(min(workers, len(tasks))) as pool:
+            written = sum(pool.imap_unordered(_fill_rows, tasks))
+    elapsed = time.perf_counter() - t0
+    print(f"[KPPB] Encoded {written} rows to {path} in {elapsed:.1f}s "
+          f"({written / max(elapsed, 1e-9):,.0f} rows/s)", file=stream)
+    return written
+
+
+class CompactManifest:
+    """Read-only view of a .kppbm file. `codes` is the memory-mapped
+    structured array; prompts are rendered from it on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header, offset = _read_header(path)
+        self.fields = tuple(c["field"] for c in self.header["columns"])
+        self.vocab = {c["field"]: tuple(c["vocab"]) for c in self.header["columns"]}
+        self.base = self.header["base"]
+        if self.header["rows"]:
+            self.codes = np.memmap(path, dtype=_dtype(self.header), mode="r", offset=offset,
+                                   shape=(self.header["rows"],))
+        else:
+            self.codes = np.zeros(0, dtype=_dtype(self.header))
+        self._builder = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return f"CompactManifest({self.path!r}, rows={len(self)}, fields={self.fields})"
+
+    def code(self, field, value):
+        """Code of `value` in a column (for filtering `codes` directly)."""
+        try:
+            return self.vocab[field].index(value)
+        except ValueError:
+            raise ValueError(f"{value!r} is not in the {field} vocabulary") from None
+
+    def where(self, **values):
+        """Row indices whose columns equal the given values, e.g.
+        where(pose="standing", scene_type="beach")."""
+        mask = np.ones(len(self), dtype=bool)
+        for field, value in values.items():
+            if field not in self.vocab:
+                raise ValueError(f"{field} is not a column (fixed fields: {', '.join(self.base)})")
+            mask &= self.codes[field] == self.code(field, value)
+        return np.flatnonzero(mask)
+
+    def row(self, index):
+        """Decoded {field: value} for one row."""
+        record = self.codes[index]
+        return {f: self.vocab[f][int(record[f])] for f in self.fields}
+
+    def render(self, index):
+        """(positive, negative, spec) for one row."""
+        if self._builder is None:
+            self._builder = _nodes.KPPBPromptBuilder()
+        kwargs = dict(self.base)
+        kwargs.update(self.row(index))
+        positive, negative, _, spec, _ = self._builder.build_prompt(**kwargs)
+        return positive, negative, spec
+
+    def iter_prompts(self, start=0, stop=None):
+        """Yield (index, positive, negative, spec) for rows [start, stop)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield (index, *self.render(index))
+
+
+def is_compact(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
@@ -0,0 +1,135 @@
+"""
+Sharded manifest generation across a process pool.
+The plan's index range is cut into contiguous shards; each worker renders its
+shards straight to disk and manifest.json indexes them in order. Cell seeds
+come from the plan seed and the global index, so output is byte-identical
+across reruns, worker counts and shard counts.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .plan import BuildPlan, prompt_record
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def shard_ranges(size, shards):
+    """Split [0, size) into `shards` contiguous (start, stop) ranges whose
+    lengths differ by at most one."""
+    shards = max(1, min(shards, size)) if size else 1
+    step, extra = divmod(size, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def shard_name(shard, shards):
+    width = max(5, len(str(shards - 1)))
+    return f"shard-{shard:0{width}d}.jsonl"
+
+
+def _render_shard(task):
+    """Worker: render plan indices [start, stop) to one shard file."""
+    plan_data, out_dir, shard, shards, start, stop = task
+    plan = BuildPlan(plan_data)
+    name = shard_name(shard, shards)
+    digest = hashlib.sha256()
+    count = 0
+    t0 = time.perf_counter()
+    with open(os.path.join(out_dir, name), "wb", buffering=1 << 20) as f:
+        for record in plan.iter_prompts(start, stop):
+            line = (prompt_record(*record) + "\n").encode("utf-8")
+            digest.update(line)
+            f.write(line)
+            count += 1
+    return {
+        "shard": shard,
+        "file": name,
+        "start": start,
+        "stop": stop,
+        "count": count,
+        "sha256": digest.hexdigest(),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def build_sharded(plan_data, out_dir, workers=None, shards=None, limit=None, stream=None):
+    """Render a plan into shard files under out_dir and write manifest.json.
+
+    workers: process count (default: all CPUs). shards: number of output
+    files (default: 4 per worker, so slow shards don't leave cores idle).
+    Returns the manifest dict."""
+    stream = stream or sys.stderr
+    plan = BuildPlan(plan_data)
+    workers = max(1, workers or os.cpu_count() or 1)
+    size = len(plan) if limit is None else min(limit, len(plan))
+    ranges = shard_ranges(size, shards or workers * 4)
+    if not plan.deterministic:
+        print("[KPPB] Warning: plan uses 'random' without a seed — output will differ between runs",
+              file=stream)
+
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(plan_data, out_dir, i, len(ranges), start, stop)
+             for i, (start, stop) in enumerate(ranges)]
+    print(f"[KPPB] {plan.mode} plan: {size} prompts in {len(tasks)} shards on {workers} workers",
+          file=stream, flush=True)
+
+    results = []
+    done = 0
+    t0 = time.perf_counter()
+    if workers == 1:
+        finished = map(_render_shard, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.get_context().Pool(min(workers, len(tasks)))
+        finished = pool.imap_unordered(_render_shard, tasks)
+    try:
+        for result in finished:
+            results.append(result)
+            done += result["count"]
+            elapsed = time.perf_counter() - t0
+            print(f"[KPPB] shard {len(results)}/{len(tasks)}: {done}/{size} in {elapsed:.1f}s "
+                  f"({done / elapsed if elapsed > 0 else 0:,.0f} prompts/s)", file=stream, flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    results.sort(key=lambda r: r["shard"])
+    for r in results:
+        del r["seconds"]
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "mode": plan.mode,
+        "plan": plan_data,
+        "count": done,
+        "shards": results,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def merge_shards(out_dir, target):
+    """Concatenate a sharded manifest's files, in index order, into one JSONL."""
+    with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    with open(target, "wb") as out:
+        for shard in manifest["shards"]:
+            with open(os.path.join(out_dir, shard["file"]), "rb") as src:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+    return manifest["count"]
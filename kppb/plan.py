@@ -0,0 +1,155 @@
+"""
+Build plans for headless prompt generation.
+A plan is a JSON object with fixed Prompt Builder arguments ("base") plus
+either a "grid" (cartesian sweep) or a "sample" (unique low-discrepancy
+draws). Every plan is index-addressable, so any slice of it can be rendered
+without rendering what comes before.
+
+    {"base": {"subject": "blonde woman", "seed": 7},
+     "grid": {"pose": ["standing", "sitting"], "scene_type": "all"}}
+
+    {"base": {"subject": "blonde woman"},
+     "sample": {"fields": ["pose", "scene_type", "lighting_setup"],
+                "count": 100000, "seed": 0}}
+"""
+
+import json
+import sys
+
+from . import core
+
+_nodes = core("nodes")
+_specs = core("specs")
+
+PLAN_KEYS = ("base", "grid", "sample")
+SAMPLE_KEYS = ("fields", "count", "seed", "start")
+
+
+def _builder_args():
+    inputs = _nodes.KPPBPromptBuilder.INPUT_TYPES()
+    return set(inputs["required"]) | set(inputs.get("optional", {}))
+
+
+def load_plan(path):
+    """Read a plan from a JSON file ("-" reads stdin)."""
+    try:
+        if path == "-":
+            return BuildPlan(json.load(sys.stdin))
+        with open(path, "r", encoding="utf-8") as f:
+            return BuildPlan(json.load(f))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Plan {path} is not valid JSON: {e}") from e
+
+
+class BuildPlan:
+    """Grid or sampler spec resolved against the Prompt Builder vocabularies."""
+
+    def __init__(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("Plan must be a JSON object")
+        unknown = [k for k in data if k not in PLAN_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown plan keys: {', '.join(unknown)}. Expected: {', '.join(PLAN_KEYS)}")
+        if ("grid" in data) == ("sample" in data):
+            raise ValueError('Plan needs exactly one of "grid" or "sample"')
+        self.data = data
+
+        args = _builder_args()
+        base = dict(data.get("base") or {})
+        unknown = [k for k in base if k not in args]
+        if unknown:
+            raise ValueError(f"Unknown Prompt Builder arguments in base: {', '.join(unknown)}")
+        self.seed = int(base.pop("seed", -1))
+        self.base = dict.fromkeys(_nodes.PROMPT_SPACE_FIELDS, "unset")
+        self.base.update(subject="", preserve_identity=True)
+        self.base.update(base)
+
+        if "grid" in data:
+            self.mode = "grid"
+            self.space = self._grid_space(data["grid"], args)
+            self.sampler = None
+            self.start = 0
+            self.size = self.space.size
+        else:
+            self.mode = "sample"
+            sample = data["sample"]
+            unknown = [k for k in sample if k not in SAMPLE_KEYS]
+            if unknown:
+                raise ValueError(f"Unknown sample keys: {', '.join(unknown)}. Expected: {', '.join(SAMPLE_KEYS)}")
+            fields = sample.get("fields") or ""
+            if not isinstance(fields, str):
+                fields = ",".join(fields)
+            self.space = _nodes.prompt_spec_space(_nodes.parse_space_fields(fields))
+            self.sampler = _specs.SpecSampler(self.space, int(sample.get("seed", 0)))
+            self.start = int(sample.get("start", 0))
+            available = max(0, len(self.sampler) - self.start)
+            self.size = min(int(sample.get("count", available)), available)
+
+    @staticmethod
+    def _grid_space(grid, args):
+        if not isinstance(grid, dict) or not grid:
+            raise ValueError('"grid" must map Prompt Builder fields to option lists')
+        axes = []
+        for field, values in grid.items():
+            if field not in args or field == "seed":
+                raise ValueError(f"Unknown grid field: {field}")
+            vocab = _nodes.RANDOM_FIELDS.get(field)
+            if values == "all":
+                if vocab is None:
+                    raise ValueError(f'"all" needs a dropdown field, {field} is free text')
+                values = _nodes._pool(vocab).options
+            elif isinstance(values, str) or not values:
+                raise ValueError(f'Grid field {field} must be a non-empty list or "all"')
+            elif vocab is not None:
+                unknown = [v for v in values if v not in vocab]
+                if unknown:
+                    raise ValueError(f"Unknown {field} options: {', '.join(map(str, unknown))}")
+            axes.append((field, values))
+        return _specs.SpecSpace(axes, _nodes.INCOMPATIBLE_OPTIONS)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def deterministic(self):
+        """True when reruns render identical prompts: a fixed seed, or no
+        "random" values left to resolve."""
+        if self.seed >= 0:
+            return True
+        values = list(self.base.values())
+        for axis in self.space.values:
+            values.extend(axis)
+        return "random" not in values
+
+    def iter_specs(self, start=0, stop=None):
+        """Yield (index, {field: value}) for plan indices [start, stop)."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return iter(())
+        if self.sampler is not None:
+            cells = self.sampler.iter_range(self.start + start, self.start + stop)
+        else:
+            cells = self.space.iter_range(start, stop)
+        return enumerate(cells, start)
+
+    def iter_prompts(self, start=0, stop=None):
+        """Yield (index, positive, negative, spec) for plan indices [start, stop).
+        Cell seeds derive from the plan seed and the global index, so any
+        slice renders exactly as it would inside a full run."""
+        builder = _nodes.KPPBPromptBuilder()
+        for index, cell in self.iter_specs(start, stop):
+            kwargs = dict(self.base)
+            kwargs.update(cell)
+            kwargs["seed"] = self.seed + index if self.seed >= 0 else -1
+            positive, negative, _, spec, _ = builder.build_prompt(**kwargs)
+            yield index, positive, negative, spec
+
+
+def prompt_record(index, positive, negative, spec):
+    """One JSONL line for a rendered prompt."""
+    return json.dumps({
+        "index": index,
+        "positive": positive,
+        "negative": negative,
+        "spec": spec.to_dict(),
+    }, ensure_ascii=False)
@@ -3,21 +3,68 @@ List nodes with boolean toggles for ComfyLab-Pack XY Plot Queue compatibility.
 Each outputs RETURN_TYPES = ('LIST', 'INT') for direct connection to dim1/dim2.
 """
 
+import os
 
-def _build_list_from_bools(items, custom_entries="", **kwargs):
-    """Collect toggled-on items + custom entries into a list."""
-    result = []
-    for item in items:
-        if kwargs.get(item, False):
-            result.append(item)
-    if custom_entries and custom_entries.strip():
-        for line in custom_entries.strip().split("\n"):
-            line = line.strip()
-            if line:
-                result.append(line)
+from .config import cached_input_types
+from .entries import load_entries, resolve_entries_path
+from .selection import vocabulary_index
+
+
+def _custom_lines(custom_entries):
+    """Non-empty lines of a custom_entries field."""
+    if not custom_entries or not custom_entries.strip():
+        return []
+    return [line.strip() for line in custom_entries.strip().split("\n") if line.strip()]
+
+
+def _with_file_entries(result, custom_entries_file):
+    """Append a custom_entries_file's entries (see entries.py)."""
+    if custom_entries_file and custom_entries_file.strip():
+        result = result + load_entries(custom_entries_file)
     return (result, len(result))
 
 
+def _file_stamp(custom_entries_file=""):
+    """IS_CHANGED helper: re-run when the entries file changes on disk."""
+    if not custom_entries_file or not custom_entries_file.strip():
+        return ""
+    try:
+        st = os.stat(resolve_entries_path(custom_entries_file))
+    except (OSError, ValueError):
+        return float("nan")
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _build_list_from_bools(items, custom_entries="", select="", custom_entries_file="", **kwargs):
+    """Collect toggled-on items, refined by the `select` expression (see
+    selection.py), + custom entries (inline, then from a file) into a list."""
+    if select and select.strip():
+        vocab = vocabulary_index(tuple(items))
+        toggled = sum(1 << i for i, item in enumerate(vocab.items) if kwargs.get(item, False))
+        result = vocab.select(select, toggled)
+    else:
+        result = [item for item in items if kwargs.get(item, False)]
+    result.extend(_custom_lines(custom_entries))
+    return _with_file_entries(result, custom_entries_file)
+
+
+_SELECT_INPUT = ("STRING", {
+    "multiline": True, "default": "",
+    "placeholder": "all; -/lying|kneel/; random 12 seed 7",
+    "tooltip": "Selection expression applied on top of the toggles: all, none, indices/ranges (3, 5-9), "
+               "0x bitmask, [start:stop:step], /regex/, *glob*, text, 'random K seed S', 'first K'. "
+               "Terms split by ; or newlines, applied left to right; prefix '-' to exclude",
+})
+
+
+_ENTRIES_FILE_INPUT = ("STRING", {
+    "default": "",
+    "placeholder": "entries.txt / .csv / .jsonl",
+    "tooltip": "File of extra entries (one per line; CSV first or entry/value/text/name column; JSONL strings or objects). "
+               "Path inside the ComfyUI input folder. Deduplicated and cached until the file changes",
+})
+
+
 def _make_input_types(items):
     """Build INPUT_TYPES dict with a boolean per item + custom multiline."""
     inputs = {"required": {}}
@@ -26,6 +73,7 @@ def _make_input_types(items):
     inputs["required"]["custom_entries"] = (
         "STRING", {"multiline": True, "default": ""}
     )
+    inputs["optional"] = {"select": _SELECT_INPUT, "custom_entries_file": _ENTRIES_FILE_INPUT}
     return inputs
 
 
@@ -61,9 +109,14 @@ class KPPBSceneList:
     ITEMS = SCENE_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -145,9 +198,14 @@ class KPPBPoseList:
     ITEMS = POSE_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -186,9 +244,14 @@ class KPPBShotTypeList:
     ITEMS = SHOT_TYPE_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -224,9 +287,14 @@ class KPPBCameraAngleList:
     ITEMS = CAMERA_ANGLE_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -265,9 +333,14 @@ class KPPBLightingList:
     ITEMS = LIGHTING_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -321,9 +394,14 @@ class KPPBOutfitList:
     ITEMS = OUTFIT_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -380,9 +458,14 @@ class KPPBImageEditList:
     ITEMS = IMAGE_EDIT_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -441,9 +524,14 @@ class KPPBHairstyleList:
     ITEMS = HAIRSTYLE_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -481,9 +569,14 @@ class KPPBIGEffectList:
     ITEMS = IG_EFFECT_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -539,9 +632,14 @@ class KPPBActionList:
     ITEMS = ACTION_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -589,9 +687,14 @@ class KPPBGroupActionList:
     ITEMS = GROUP_ACTION_ITEMS
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return _make_input_types(cls.ITEMS)
 
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
     RETURN_TYPES = ("LIST", "INT")
     RETURN_NAMES = ("list", "count")
     FUNCTION = "build_list"
@@ -601,3 +704,61 @@ class KPPBGroupActionList:
         return _build_list_from_bools(self.ITEMS, custom_entries, **kwargs)
 
 
+# ══════════════════════════════════════════════
+# MULTI-SELECT LIST (one compact input per vocabulary)
+# ══════════════════════════════════════════════
+
+# Vocabulary name -> items, in dropdown order
+LIST_VOCABULARIES = {
+    "scene": SCENE_ITEMS,
+    "pose": POSE_ITEMS,
+    "shot type": SHOT_TYPE_ITEMS,
+    "camera angle": CAMERA_ANGLE_ITEMS,
+    "lighting": LIGHTING_ITEMS,
+    "outfit": OUTFIT_ITEMS,
+    "image edit": IMAGE_EDIT_ITEMS,
+    "hairstyle": HAIRSTYLE_ITEMS,
+    "ig effect": IG_EFFECT_ITEMS,
+    "action": ACTION_ITEMS,
+    "group action": GROUP_ACTION_ITEMS,
+}
+
+
+class KPPBMultiSelectList:
+    """Any list vocabulary with one compact selection input instead of a
+    BOOLEAN per item, so node size stays constant however long the
+    vocabulary grows. Outputs LIST for XY Plot."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "vocabulary": (list(LIST_VOCABULARIES), {"default": "pose"}),
+                "selection": ("STRING", {"default": "",
+                                         "placeholder": "0, 3, 5-9  or  0x3e9",
+                                         "tooltip": "Item indices (0-based, in the list's alphabetical order) and ranges, a hex bitmask, "
+                                                    "or any selection expression (see select on the list nodes)"}),
+                "custom_entries": ("STRING", {"multiline": True, "default": ""}),
+            },
+            "optional": {
+                "custom_entries_file": _ENTRIES_FILE_INPUT,
+            },
+        }
+
+    @classmethod
+    def IS_CHANGED(cls, custom_entries_file="", **kwargs):
+        return _file_stamp(custom_entries_file)
+
+    RETURN_TYPES = ("LIST", "INT")
+    RETURN_NAMES = ("list", "count")
+    FUNCTION = "build_list"
+    CATEGORY = "conditioning/klein"
+
+    def build_list(self, vocabulary, selection="", custom_entries="", custom_entries_file=""):
+        items = LIST_VOCABULARIES.get(vocabulary)
+        if items is None:
+            raise ValueError(f"Unknown vocabulary '{vocabulary}'. Choose from: {', '.join(LIST_VOCABULARIES)}")
+        result = vocabulary_index(tuple(items)).select(selection)
+        result.extend(_custom_lines(custom_entries))
+        return _with_file_entries(result, custom_entries_file)
@@ -1,14 +1,13 @@
+import functools
+import hashlib
 import json
-import os
 import random
 
-# ── NSFW config ──
-_DIR = os.path.dirname(os.path.abspath(__file__))
-try:
-    with open(os.path.join(_DIR, "config.json"), "r") as _f:
-        _NSFW_ENABLED = json.load(_f).get("nsfw", False)
-except (FileNotFoundError, json.JSONDecodeError):
-    _NSFW_ENABLED = False
+from .config import cached_input_types, nsfw_enabled
+from .nsfw_sync import nsfw_populated
+from .prompt_text import PhraseExpander, parse_expansions, parse_trim_order, trim_sections
+from .sampling import SamplingTable, parse_weight_spec
+from .specs import Constraints, OptionList, PromptSpec, SpecSpace
 
 # ──────────────────────────────────────────────
 # Identity preservation phrase (appended when
@@ -31,12 +30,67 @@ _RND = "random"
 _SKIP_RANDOM = {_REF, _RND, "custom", "unset", "remove", "inherit from scene"}
 
 
-def _resolve_random(value, options):
-    """If value is 'random', pick a random concrete option (skip meta values)."""
+def _field_rng(seed, field):
+    """Per-call RNG stream for one field. A fixed seed gives reproducible picks
+    that don't depend on the global RNG or on which other fields are random;
+    seed < 0 draws fresh entropy every call."""
+    if seed is None or seed < 0:
+        return random.Random()
+    return random.Random(f"{seed}:{field}")
+
+
+# Concrete (non-meta) option pools, keyed by vocabulary — filled once at
+# import for every RANDOM_FIELDS vocabulary (see below the outfit lists)
+_POOLS = {}
+
+
+def _pool(options):
+    """Precomputed SamplingTable of the concrete options in a vocabulary."""
+    table = _POOLS.get(id(options))
+    if table is None:
+        table = SamplingTable(v for v in options if v not in _SKIP_RANDOM)
+    return table
+
+
+def _resolve_random(value, options, seed=-1, field="", weights=None, chosen=None, rules=None):
+    """If value is 'random', pick a random concrete option (skip meta values).
+    weights: per-field SamplingTables from _weight_tables() overriding the
+    uniform pool. chosen: {field: value} of the other fields — the pick is
+    restricted to options compatible with them (`rules`, default _RULES) and
+    written back so later random fields respect it too."""
     if value != _RND:
         return value
-    concrete = [v for v in options if v not in _SKIP_RANDOM]
-    return random.choice(concrete) if concrete else _REF
+    table = weights.get(field) if weights else None
+    if table is None:
+        table = _pool(options)
+    rng = _field_rng(seed, field)
+    allowed = (_RULES if rules is None else rules).allowed(field, chosen) if chosen else None
+    if allowed is None:
+        pick = table.draw(rng) if table else _REF
+    else:
+        pick = table.draw_subset(rng, allowed) or _REF
+    if chosen is not None:
+        chosen[field] = pick
+    return pick
+
+
+def _has_random(value):
+    """True for 'random' or a (nested) list holding it."""
+    if isinstance(value, (list, tuple)):
+        return any(_has_random(v) for v in value)
+    return value == _RND
+
+
+def _inputs_hash(seed, inputs):
+    """IS_CHANGED helper. Unseeded 'random' selections must re-run every time
+    (NaN never compares equal); everything else hashes to a stable key so
+    ComfyUI's execution cache can skip the node and downstream encoding.
+    List-native nodes pass their seed list: any negative seed is unseeded."""
+    seeds = seed if isinstance(seed, (list, tuple)) else (seed,)
+    if any(s is None or s < 0 for s in seeds) and any(_has_random(v) for v in inputs.values()):
+        return float("nan")
+    payload = json.dumps({"seed": seed, **inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 # ──────────────────────────────────────────────
@@ -69,7 +123,7 @@ LIGHTING_EXPANSIONS = {
 # ──────────────────────────────────────────────
 # IG-focused scene/location types
 # ──────────────────────────────────────────────
-SCENE_TYPES = [
+SCENE_TYPES = OptionList([
     _REF,
     _RND,
     "bedroom",
@@ -90,12 +144,12 @@ SCENE_TYPES = [
     "car",
     "stairwell",
     "hallway/corridor",
-]
+])
 
 # ──────────────────────────────────────────────
 # IG-focused shot types / framing
 # ──────────────────────────────────────────────
-SHOT_TYPES = [
+SHOT_TYPES = OptionList([
     _REF,
     _RND,
     "extreme close-up",
@@ -113,12 +167,12 @@ SHOT_TYPES = [
     "candid mid-shot",
     "from-behind candid",
     "silhouette framing",
-]
+])
 
 # ──────────────────────────────────────────────
 # IG-focused camera angles
 # ──────────────────────────────────────────────
-CAMERA_ANGLES = [
+CAMERA_ANGLES = OptionList([
     _REF,
     _RND,
     "eye level",
@@ -133,12 +187,12 @@ CAMERA_ANGLES = [
     "overhead selfie angle",
     "from below",
     "rear 3/4 angle",
-]
+])
 
 # ──────────────────────────────────────────────
 # Lenses
 # ──────────────────────────────────────────────
-LENSES = [
+LENSES = OptionList([
     _REF,
     _RND,
     "24mm wide",
@@ -149,12 +203,12 @@ LENSES = [
     "135mm",
     "iPhone front camera",
     "iPhone rear camera",
-]
+])
 
 # ──────────────────────────────────────────────
 # Depth of field
 # ──────────────────────────────────────────────
-DEPTH_OF_FIELD = [
+DEPTH_OF_FIELD = OptionList([
     _REF,
     _RND,
     "razor thin f/1.4",
@@ -163,12 +217,12 @@ DEPTH_OF_FIELD = [
     "moderate f/4",
     "standard f/5.6",
     "sharp f/8",
-]
+])
 
 # ──────────────────────────────────────────────
 # IG-focused photo styles / vibes
 # ──────────────────────────────────────────────
-PHOTO_STYLES = [
+PHOTO_STYLES = OptionList([
     _REF,
     _RND,
     "phone candid",
@@ -186,12 +240,12 @@ PHOTO_STYLES = [
     "street style",
     "paparazzi",
     "documentary candid",
-]
+])
 
 # ──────────────────────────────────────────────
 # IG-focused poses
 # ──────────────────────────────────────────────
-POSES = [
+POSES = OptionList([
     _REF,
     _RND,
     "standing",
@@ -247,12 +301,12 @@ POSES = [
     "small jump",
     "stretch overhead",
     "yoga warrior pose",
-]
+])
 
 # ──────────────────────────────────────────────
 # Hairstyles
 # ──────────────────────────────────────────────
-HAIR_COLORS = [
+HAIR_COLORS = OptionList([
     _REF,
     _RND,
     "ash blonde",
@@ -284,9 +338,9 @@ HAIR_COLORS = [
     "strawberry blonde",
     "two-tone",
     "white",
-]
+])
 
-HAIRSTYLES = [
+HAIRSTYLES = OptionList([
     _REF,
     _RND,
     "beach waves",
@@ -324,12 +378,12 @@ HAIRSTYLES = [
     "top knot",
     "wet look",
     "wolf cut",
-]
+])
 
 # ──────────────────────────────────────────────
 # Color grading
 # ──────────────────────────────────────────────
-COLOR_GRADINGS = [
+COLOR_GRADINGS = OptionList([
     _REF,
     _RND,
     "natural",
@@ -344,24 +398,242 @@ COLOR_GRADINGS = [
     "faded film",
     "high contrast",
     "pastel soft",
-]
+])
 
-LIGHTING_SETUPS = list(LIGHTING_EXPANSIONS.keys())
+LIGHTING_SETUPS = OptionList(LIGHTING_EXPANSIONS)
 
 # ──────────────────────────────────────────────
 # NSFW expansion dicts (optional — loaded from
-# nsfw_pack if present, empty dicts otherwise)
+# nsfw_pack only when config.json enables NSFW,
+# empty dicts otherwise)
+# ──────────────────────────────────────────────
+NSFW_POSE_EXPANSIONS = {}
+NSFW_ACTION_EXPANSIONS = {}
+NSFW_GROUP_ACTION_EXPANSIONS = {}
+
+# Checked before the background sync starts (see __init__), so a pending
+# clean can't leak NSFW expansions into SFW prompts. Another process syncing
+# the same folder can still remove files mid-import, hence the broad except.
+if nsfw_enabled() and nsfw_populated():
+    try:
+        from .nsfw_pack.nsfw_data import (
+            NSFW_POSE_EXPANSIONS,
+            NSFW_ACTION_EXPANSIONS,
+            NSFW_GROUP_ACTION_EXPANSIONS,
+        )
+    except Exception as e:
+        print(f"[KPPB] Warning: NSFW expansions failed to load: {e}")
+
+
+# ──────────────────────────────────────────────
+# Prompt sections — pure functions of their own
+# inputs, each behind a bounded LRU memo so grid
+# sweeps only recompute the sections that change
 # ──────────────────────────────────────────────
-try:
-    from .nsfw_pack.nsfw_data import (
-        NSFW_POSE_EXPANSIONS,
-        NSFW_ACTION_EXPANSIONS,
-        NSFW_GROUP_ACTION_EXPANSIONS,
-    )
-except ImportError:
-    NSFW_POSE_EXPANSIONS = {}
-    NSFW_ACTION_EXPANSIONS = {}
-    NSFW_GROUP_ACTION_EXPANSIONS = {}
+_SECTION_CACHE_SIZE = 1024
+_SECTIONS = {}
+
+
+def _section(fn):
+    """Memoize a prompt section and register it for section_cache_info()."""
+    cached = functools.lru_cache(maxsize=_SECTION_CACHE_SIZE)(fn)
+    _SECTIONS[fn.__name__.strip("_").replace("_section", "")] = cached
+    return cached
+
+
+def section_cache_info():
+    """Hit/miss counters of every prompt section memo, e.g. to confirm the
+    saving on a large grid: {section: {"hits", "misses", "size"}}."""
+    return {name: {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+            for name, info in ((name, fn.cache_info()) for name, fn in _SECTIONS.items())}
+
+
+def clear_section_caches():
+    for fn in _SECTIONS.values():
+        fn.cache_clear()
+
+
+# All shorthand tables in one automaton (pose entries win on duplicates)
+_EXPANDER = PhraseExpander(NSFW_POSE_EXPANSIONS, NSFW_ACTION_EXPANSIONS, NSFW_GROUP_ACTION_EXPANSIONS)
+
+
+@functools.lru_cache(maxsize=16)
+def _expander(custom_expansions=""):
+    """Built-in expander, extended with the user's custom_expansions JSON
+    (user entries win). Cached per distinct input text."""
+    custom = parse_expansions(custom_expansions)
+    if not custom:
+        return _EXPANDER
+    return PhraseExpander(custom, NSFW_POSE_EXPANSIONS, NSFW_ACTION_EXPANSIONS, NSFW_GROUP_ACTION_EXPANSIONS)
+
+
+def _cap(text):
+    return text[0].upper() + text[1:] if text else text
+
+
+@_section
+def _opener_section(subject, photo_style, pose, expander=_EXPANDER):
+    # Style + generic subject (identity comes from ReferenceLatent, not text)
+    subj_label = subject.strip() if subject.strip() else "the character from the reference image"
+    if photo_style != _REF:
+        opener = f"{photo_style.capitalize()} photo of {subj_label}"
+    else:
+        opener = f"Photo of {subj_label}"
+    # Append pose (expand NSFW shorthand → explicit)
+    if pose != _REF:
+        opener += f", {expander.expand(pose)}"
+    return opener
+
+
+@_section
+def _action_section(action, expander=_EXPANDER):
+    if action and action.strip():
+        return expander.expand(action.strip()).rstrip(".")
+    return ""
+
+
+@_section
+def _hair_section(hair_color, hairstyle):
+    # Color + style, only if changed from reference
+    hair_parts = []
+    if hair_color and hair_color != _REF:
+        hair_parts.append(hair_color)
+    if hairstyle and hairstyle != _REF:
+        hair_parts.append(f"{hairstyle} hair")
+    return " ".join(hair_parts).capitalize()
+
+
+@_section
+def _outfit_section(outfit):
+    if outfit and outfit.strip():
+        return outfit.strip().rstrip(".")
+    return ""
+
+
+@_section
+def _exposure_section(expose_breasts, remove_bra, remove_panties):
+    """Exposure control phrases — only used when NSFW mode is on."""
+    exposure = []
+    if expose_breasts:
+        exposure.append("clothing adjusted to expose breasts")
+        if remove_bra:
+            exposure.append("no bra")
+    else:
+        exposure.append("nipples fully concealed by clothing, fabric, hands, or hair")
+        exposure.append("breasts fully covered by outfit")
+    if remove_panties:
+        exposure.append("not wearing panties")
+    else:
+        exposure.append("underwear or lingerie covering intimate areas")
+    return ", ".join(exposure)
+
+
+_ENV_PREPS = ("in ", "at ", "on ", "near ", "by ", "inside ", "outside ",
+              "under ", "above ", "along ", "within ")
+
+
+@_section
+def _environment_section(environment, scene_type, expander=_EXPANDER):
+    if environment and environment.strip():
+        env = expander.expand(environment.strip())
+        if not env.lower().startswith(_ENV_PREPS):
+            return f"In {env}"
+        return _cap(env)
+    if scene_type != _REF:
+        article = "an" if scene_type[0].lower() in "aeiou" else "a"
+        return f"In {article} {scene_type} setting"
+    return ""
+
+
+@_section
+def _extra_section(extra_details, expander=_EXPANDER):
+    if extra_details and extra_details.strip():
+        return _cap(expander.expand(extra_details.strip()).rstrip("."))
+    return ""
+
+
+@_section
+def _lighting_section(lighting_setup, scene_type, lighting_custom):
+    # Most impactful section for Klein 9B
+    if lighting_setup == _INHERIT_SCENE and scene_type != _REF:
+        lighting_prose = f"lighting natural to a {scene_type} setting"
+    elif lighting_setup == _INHERIT_SCENE or lighting_setup == _REF:
+        lighting_prose = ""
+    else:
+        lighting_prose = LIGHTING_EXPANSIONS.get(lighting_setup, "")
+    if lighting_custom and lighting_custom.strip():
+        if lighting_prose:
+            lighting_prose = f"{lighting_prose}, {lighting_custom.strip()}"
+        else:
+            lighting_prose = lighting_custom.strip()
+    return _cap(lighting_prose)
+
+
+@_section
+def _technical_section(shot_type, camera_angle, lens, depth_of_field):
+    # Shot type, angle, lens, DoF — only include overridden fields
+    tech_parts = []
+    if shot_type != _REF:
+        tech_parts.append(shot_type.capitalize())
+    if camera_angle != _REF:
+        tech_parts.append(camera_angle)
+    if lens != _REF:
+        tech_parts.append(f"{lens} lens")
+    if depth_of_field != _REF:
+        dof_words = depth_of_field.split()
+        tech_parts.append(f"{dof_words[0]} depth of field at {dof_words[-1]}")
+    return ", ".join(tech_parts)
+
+
+@_section
+def _mood_section(mood, color_grading):
+    tail = []
+    if mood and mood.strip():
+        tail.append(f"{_cap(mood.strip())} mood")
+    if color_grading != _REF and color_grading != "natural":
+        tail.append(f"{_cap(color_grading)} color grading")
+    return ". ".join(tail)
+
+
+@_section
+def _edits_section(edit_instructions):
+    if edit_instructions and edit_instructions.strip():
+        return edit_instructions.strip().rstrip(".")
+    return ""
+
+
+@_section
+def _identity_section(preserve_identity):
+    return IDENTITY_LOCK_PROMPT if preserve_identity else ""
+
+
+@_section
+def _negative_section(negative_prompt, nsfw, expose_breasts, remove_panties):
+    neg_parts = []
+    if negative_prompt and negative_prompt.strip():
+        neg_parts.append(negative_prompt.strip())
+    # Always-on quality negatives
+    neg_parts.append("saggy breasts, torpedo breasts, droopy breasts, pendulous breasts, tubular breasts, uneven breasts, deflated breasts")
+    neg_parts.append("extra fingers, extra hands, extra limbs, missing fingers, fused fingers, mutated hands, deformed hands, phantom limb, floating hand, disembodied hand, extra arms, bad anatomy, malformed limbs, wrong number of fingers, six fingers, disfigured, ugly, blurry, watermark, text, logo, signature")
+    # Exposure-based negatives
+    if nsfw:
+        if not expose_breasts:
+            neg_parts.append("exposed nipples, bare breasts, lifted shirt, shirt pulled up, topless, areola visible")
+        if not remove_panties:
+            neg_parts.append("exposed genitals, no underwear, pantyless, bottomless")
+    return ", ".join(neg_parts)
+
+
+@_section
+def _json_section(items):
+    """Serialized prompt_json for a tuple of (key, value) pairs."""
+    return json.dumps(dict(items), indent=2)
+
+
+@_section
+def _spec_section(items):
+    """PromptSpec for a tuple of (key, value) pairs."""
+    return PromptSpec(items)
 
 
 # ══════════════════════════════════════════════
@@ -371,6 +643,7 @@ class KPPBPromptBuilder:
     """IG-focused photorealistic prompt builder for FLUX.2 Klein 9B."""
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         inputs = {
             "required": {
@@ -400,17 +673,34 @@ class KPPBPromptBuilder:
                 "negative_prompt": ("STRING", {"multiline": True, "default": ""}),
             },
         }
-        if _NSFW_ENABLED:
+        if nsfw_enabled():
             inputs["optional"]["expose_breasts"] = ("BOOLEAN", {"default": False,
                 "tooltip": "ON: clothing adjusted to reveal breasts. OFF: nipples always concealed by fabric, hands, or hair"})
             inputs["optional"]["remove_bra"] = ("BOOLEAN", {"default": False,
                 "tooltip": "No bra under clothing"})
             inputs["optional"]["remove_panties"] = ("BOOLEAN", {"default": False,
                 "tooltip": "No panties/underwear — only visible if pose or camera angle reveals it"})
+        inputs["optional"]["seed"] = ("INT", {"default": -1, "min": -1, "max": 2147483647,
+            "tooltip": "Seed for 'random' selections. -1 picks fresh values every run"})
+        inputs["optional"]["random_weights"] = ("STRING", {"multiline": True, "default": "",
+            "placeholder": '{"lighting_setup": {"golden hour": 3, "direct flash": 0}}',
+            "tooltip": "Per-field weights for 'random' selections (JSON). Weight 0 excludes an option"})
+        inputs["optional"]["custom_expansions"] = ("STRING", {"multiline": True, "default": "",
+            "placeholder": '{"gh": "warm golden hour backlight", "wet look": "hair and skin glistening with water"}',
+            "tooltip": "Extra shorthand -> expansion phrases (JSON), replaced wherever they appear in pose, action, environment and extra_details"})
+        inputs["optional"]["max_tokens"] = ("INT", {"default": 0, "min": 0, "max": 4096,
+            "tooltip": "Estimated text-encoder token budget (Klein reads 512). Over budget, sections are dropped in trim_order. 0 = no limit"})
+        inputs["optional"]["trim_order"] = ("STRING", {"default": "",
+            "placeholder": "mood, extra, technical, hair, environment, lighting, action, outfit",
+            "tooltip": "Sections to drop first when over max_tokens (opener, action, hair, outfit, exposure, environment, extra, lighting, technical, mood, edits, identity)"})
         return inputs
 
-    RETURN_TYPES = ("STRING", "STRING", "STRING")
-    RETURN_NAMES = ("positive_prompt", "negative_prompt", "prompt_json")
+    @classmethod
+    def IS_CHANGED(cls, seed=-1, **kwargs):
+        return _inputs_hash(seed, kwargs)
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "KPPB_SPEC", "INT")
+    RETURN_NAMES = ("positive_prompt", "negative_prompt", "prompt_json", "spec", "token_count")
     FUNCTION = "build_prompt"
     CATEGORY = "conditioning/klein"
 
@@ -440,155 +730,55 @@ class KPPBPromptBuilder:
         expose_breasts=False,
         remove_bra=False,
         remove_panties=False,
+        seed=-1,
+        random_weights="",
+        custom_expansions="",
+        max_tokens=0,
+        trim_order="",
     ):
         # ── Resolve "random" selections ──
-        pose = _resolve_random(pose, POSES)
-        scene_type = _resolve_random(scene_type, SCENE_TYPES)
-        shot_type = _resolve_random(shot_type, SHOT_TYPES)
-        camera_angle = _resolve_random(camera_angle, CAMERA_ANGLES)
-        lighting_setup = _resolve_random(lighting_setup, LIGHTING_SETUPS)
-        photo_style = _resolve_random(photo_style, PHOTO_STYLES)
-        lens = _resolve_random(lens, LENSES)
-        depth_of_field = _resolve_random(depth_of_field, DEPTH_OF_FIELD)
-        color_grading = _resolve_random(color_grading, COLOR_GRADINGS)
-        hairstyle = _resolve_random(hairstyle, HAIRSTYLES)
-        hair_color = _resolve_random(hair_color, HAIR_COLORS)
-
-        _is_ref = lambda v: v == _REF
-        _expand = lambda v: NSFW_POSE_EXPANSIONS.get(v, NSFW_ACTION_EXPANSIONS.get(v, NSFW_GROUP_ACTION_EXPANSIONS.get(v, v)))
-        sentences = []
-
-        # 1. Opening: style + generic subject (identity comes from ReferenceLatent, not text)
-        subj_label = subject.strip() if subject.strip() else "the character from the reference image"
-        opener = ""
-        if not _is_ref(photo_style):
-            style_label = photo_style.capitalize()
-            opener = f"{style_label} photo of {subj_label}"
-        else:
-            opener = f"Photo of {subj_label}"
-
-        # Append pose (expand NSFW shorthand → explicit)
-        if not _is_ref(pose):
-            opener += f", {_expand(pose)}"
-
-        sentences.append(opener)
-
-        # 2. Action (expand NSFW shorthand → explicit)
-        if action and action.strip():
-            sentences.append(_expand(action.strip()).rstrip("."))
-
-        # 3. Hair (color + style, only if changed from reference)
-        hair_parts = []
-        if hair_color and not _is_ref(hair_color):
-            hair_parts.append(hair_color)
-        if hairstyle and not _is_ref(hairstyle):
-            hair_parts.append(f"{hairstyle} hair")
-        if hair_parts:
-            sentences.append(" ".join(hair_parts).capitalize())
-
-        # 3. Outfit (from Outfit Composer or manual)
-        if outfit and outfit.strip():
-            sentences.append(outfit.strip().rstrip("."))
-
-        # 3b. Exposure control (after outfit) — only when NSFW mode is on
-        if _NSFW_ENABLED:
-            exposure = []
-            if expose_breasts:
-                exposure.append("clothing adjusted to expose breasts")
-                if remove_bra:
-                    exposure.append("no bra")
-            else:
-                exposure.append("nipples fully concealed by clothing, fabric, hands, or hair")
-                exposure.append("breasts fully covered by outfit")
-            if remove_panties:
-                exposure.append("not wearing panties")
-            else:
-                exposure.append("underwear or lingerie covering intimate areas")
-            sentences.append(", ".join(exposure).capitalize())
-
-        # 4. Environment / scene
-        if environment and environment.strip():
-            env = environment.strip()
-            lower = env.lower()
-            preps = ("in ", "at ", "on ", "near ", "by ", "inside ", "outside ",
-                     "under ", "above ", "along ", "within ")
-            if not any(lower.startswith(p) for p in preps):
-                sentences.append(f"In {env}")
-            else:
-                sentences.append(env[0].upper() + env[1:])
-        elif not _is_ref(scene_type):
-            article = "an" if scene_type[0].lower() in "aeiou" else "a"
-            sentences.append(f"In {article} {scene_type} setting")
-
-        # 5. Extra details
-        if extra_details and extra_details.strip():
-            d = extra_details.strip().rstrip(".")
-            sentences.append(d[0].upper() + d[1:] if d else d)
-
-        # 6. Lighting (most impactful for Klein 9B)
-        if lighting_setup == _INHERIT_SCENE and not _is_ref(scene_type):
-            lighting_prose = f"lighting natural to a {scene_type} setting"
-        elif lighting_setup == _INHERIT_SCENE:
-            lighting_prose = ""
-        else:
-            lighting_prose = LIGHTING_EXPANSIONS.get(lighting_setup, "") if not _is_ref(lighting_setup) else ""
-        if lighting_custom and lighting_custom.strip():
-            if lighting_prose:
-                lighting_prose = f"{lighting_prose}, {lighting_custom.strip()}"
-            else:
-                lighting_prose = lighting_custom.strip()
-        if lighting_prose:
-            sentences.append(lighting_prose[0].upper() + lighting_prose[1:])
-
-        # 7. Technical: shot type, angle, lens, DoF — only include overridden fields
-        tech_parts = []
-        if not _is_ref(shot_type):
-            tech_parts.append(shot_type.capitalize())
-        if not _is_ref(camera_angle):
-            tech_parts.append(camera_angle)
-        if not _is_ref(lens):
-            tech_parts.append(f"{lens} lens")
-        if not _is_ref(depth_of_field):
-            dof_words = depth_of_field.split()
-            dof_desc = dof_words[0]
-            dof_fstop = dof_words[-1]
-            tech_parts.append(f"{dof_desc} depth of field at {dof_fstop}")
-        if tech_parts:
-            sentences.append(", ".join(tech_parts))
-
-        # 8. Mood + color grading
-        tail = []
-        if mood and mood.strip():
-            m = mood.strip()
-            tail.append(f"{m[0].upper() + m[1:]} mood")
-        if not _is_ref(color_grading) and color_grading != "natural":
-            cg = color_grading[0].upper() + color_grading[1:]
-            tail.append(f"{cg} color grading")
-        if tail:
-            sentences.append(". ".join(tail))
-
-        # 8. Edit instructions (from Image Edit Composer)
-        if edit_instructions and edit_instructions.strip():
-            sentences.append(edit_instructions.strip().rstrip("."))
-
-        # 9. Identity preservation (for character reference workflows)
-        if preserve_identity:
-            sentences.append(IDENTITY_LOCK_PROMPT)
+        weights = _weight_tables(random_weights)
+        chosen = {
+            "pose": pose, "scene_type": scene_type, "shot_type": shot_type,
+            "camera_angle": camera_angle, "lighting_setup": lighting_setup,
+            "photo_style": photo_style, "lens": lens, "depth_of_field": depth_of_field,
+            "color_grading": color_grading, "hairstyle": hairstyle, "hair_color": hair_color,
+        }
+        pose = _resolve_random(pose, POSES, seed, "pose", weights, chosen)
+        scene_type = _resolve_random(scene_type, SCENE_TYPES, seed, "scene_type", weights, chosen)
+        shot_type = _resolve_random(shot_type, SHOT_TYPES, seed, "shot_type", weights, chosen)
+        camera_angle = _resolve_random(camera_angle, CAMERA_ANGLES, seed, "camera_angle", weights, chosen)
+        lighting_setup = _resolve_random(lighting_setup, LIGHTING_SETUPS, seed, "lighting_setup", weights, chosen)
+        photo_style = _resolve_random(photo_style, PHOTO_STYLES, seed, "photo_style", weights, chosen)
+        lens = _resolve_random(lens, LENSES, seed, "lens", weights, chosen)
+        depth_of_field = _resolve_random(depth_of_field, DEPTH_OF_FIELD, seed, "depth_of_field", weights, chosen)
+        color_grading = _resolve_random(color_grading, COLOR_GRADINGS, seed, "color_grading", weights, chosen)
+        hairstyle = _resolve_random(hairstyle, HAIRSTYLES, seed, "hairstyle", weights, chosen)
+        hair_color = _resolve_random(hair_color, HAIR_COLORS, seed, "hair_color", weights, chosen)
+
+        # ── Sections (each memoized on its own inputs) ──
+        expander = _expander(custom_expansions)
+        nsfw = nsfw_enabled()
+        exposure = _exposure_section(expose_breasts, remove_bra, remove_panties) if nsfw else ""
+        sections = (
+            ("opener", _opener_section(subject, photo_style, pose, expander)),
+            ("action", _action_section(action, expander)),
+            ("hair", _hair_section(hair_color, hairstyle)),
+            ("outfit", _outfit_section(outfit)),
+            ("exposure", exposure.capitalize()),
+            ("environment", _environment_section(environment, scene_type, expander)),
+            ("extra", _extra_section(extra_details, expander)),
+            ("lighting", _lighting_section(lighting_setup, scene_type, lighting_custom)),
+            ("technical", _technical_section(shot_type, camera_angle, lens, depth_of_field)),
+            ("mood", _mood_section(mood, color_grading)),
+            ("edits", _edits_section(edit_instructions)),
+            ("identity", _identity_section(preserve_identity)),
+        )
+        # Drop low-priority sections past the encoder window
+        sentences, token_count = trim_sections(sections, max_tokens, parse_trim_order(trim_order))
 
         # Auto-inject negative prompt terms
-        neg_parts = []
-        if negative_prompt and negative_prompt.strip():
-            neg_parts.append(negative_prompt.strip())
-        # Always-on quality negatives
-        neg_parts.append("saggy breasts, torpedo breasts, droopy breasts, pendulous breasts, tubular breasts, uneven breasts, deflated breasts")
-        neg_parts.append("extra fingers, extra hands, extra limbs, missing fingers, fused fingers, mutated hands, deformed hands, phantom limb, floating hand, disembodied hand, extra arms, bad anatomy, malformed limbs, wrong number of fingers, six fingers, disfigured, ugly, blurry, watermark, text, logo, signature")
-        # Exposure-based negatives
-        if _NSFW_ENABLED:
-            if not expose_breasts:
-                neg_parts.append("exposed nipples, bare breasts, lifted shirt, shirt pulled up, topless, areola visible")
-            if not remove_panties:
-                neg_parts.append("exposed genitals, no underwear, pantyless, bottomless")
-        negative_prompt = ", ".join(neg_parts)
+        negative_prompt = _negative_section(negative_prompt, nsfw, expose_breasts, remove_panties)
 
         # Assemble
         positive = ". ".join(sentences)
@@ -596,35 +786,36 @@ class KPPBPromptBuilder:
         if positive and not positive.endswith("."):
             positive += "."
 
-        # JSON output
-        _v = lambda v: "" if _is_ref(v) else v
-        prompt_data = {
-            "subject": subject,
-            "pose": _v(pose),
-            "action": action,
-            "hairstyle": _v(hairstyle),
-            "hair_color": _v(hair_color),
-            "scene_type": _v(scene_type),
-            "outfit": outfit,
-            "edit_instructions": edit_instructions,
-            "environment": environment,
-            "lighting_setup": _v(lighting_setup),
-            "lighting_custom": lighting_custom,
-            "shot_type": _v(shot_type),
-            "camera_angle": _v(camera_angle),
-            "lens": _v(lens),
-            "depth_of_field": _v(depth_of_field),
-            "photo_style": _v(photo_style),
-            "mood": mood,
-            "color_grading": _v(color_grading),
-            "extra_details": extra_details,
-            "exposure": ", ".join(exposure).lower() if _NSFW_ENABLED else "",
-            "preserve_identity": preserve_identity,
-            "negative_prompt": negative_prompt,
-        }
-        prompt_json = json.dumps(prompt_data, indent=2)
-
-        return (positive, negative_prompt, prompt_json)
+        # JSON + typed spec output
+        _v = lambda v: "" if v == _REF else v
+        items = (
+            ("subject", subject),
+            ("pose", _v(pose)),
+            ("action", action),
+            ("hairstyle", _v(hairstyle)),
+            ("hair_color", _v(hair_color)),
+            ("scene_type", _v(scene_type)),
+            ("outfit", outfit),
+            ("edit_instructions", edit_instructions),
+            ("environment", environment),
+            ("lighting_setup", _v(lighting_setup)),
+            ("lighting_custom", lighting_custom),
+            ("shot_type", _v(shot_type)),
+            ("camera_angle", _v(camera_angle)),
+            ("lens", _v(lens)),
+            ("depth_of_field", _v(depth_of_field)),
+            ("photo_style", _v(photo_style)),
+            ("mood", mood),
+            ("color_grading", _v(color_grading)),
+            ("extra_details", extra_details),
+            ("exposure", exposure.lower()),
+            ("preserve_identity", preserve_identity),
+            ("negative_prompt", negative_prompt),
+        )
+        prompt_json = _json_section(items)
+        spec = _spec_section(items)
+
+        return (positive, negative_prompt, prompt_json, spec, token_count)
 
 
 # ══════════════════════════════════════════════
@@ -634,7 +825,7 @@ class KPPBPromptBuilder:
 _UNSET = "unset"
 _REMOVE = "remove"
 
-TOPS = [_UNSET, _RND, _REMOVE] + sorted([
+TOPS = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "T-shirt", "Tank top", "Crop top", "Hoodie", "Sweater", "Blouse",
     "Bodysuit", "Bustier", "Corset", "Corset top", "Lace camisole",
     "Satin camisole", "Sheer blouse", "Chiffon blouse", "Mesh top",
@@ -644,9 +835,9 @@ TOPS = [_UNSET, _RND, _REMOVE] + sorted([
     "Sleeveless turtleneck", "Cardigan", "Cropped cardigan", "Bolero shrug",
     "Band t-shirt", "Graphic tee", "Long sleeve top", "Cropped hoodie",
     "Gothic lace top", "Harness top",
-])
+]))
 
-BOTTOMS = [_UNSET, _RND, _REMOVE] + sorted([
+BOTTOMS = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "Jeans", "Shorts", "Skirt", "Leggings", "Joggers", "Cargo pants",
     "Mini skirt", "Maxi skirt", "Slacks", "Denim skirt", "Micro skirt",
     "Pleated skirt", "Tennis skirt", "Pencil skirt", "Wrap skirt",
@@ -656,26 +847,26 @@ BOTTOMS = [_UNSET, _RND, _REMOVE] + sorted([
     "Skinny jeans", "High-waisted jeans", "Bell bottoms", "Flare pants",
     "Wide-leg pants", "Palazzo pants", "Track pants", "Sweatpants",
     "Yoga pants", "Fishnet leggings", "Suspender skirt",
-])
+]))
 
-LINGERIE_TOPS = [_UNSET, _RND, _REMOVE] + sorted([
+LINGERIE_TOPS = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "Bralette", "Lace bralette", "Satin bra", "Push-up bra",
     "Balconette bra", "Plunge bra", "Strapless bra", "Triangle bra",
     "Sheer bra", "Lace bra", "Longline bra", "Cage bra", "Harness bra",
     "Lace bustier", "Lingerie corset", "Overbust corset",
     "Babydoll top", "Teddy lingerie",
-])
+]))
 
-LINGERIE_BOTTOMS = [_UNSET, _RND, _REMOVE] + sorted([
+LINGERIE_BOTTOMS = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "Lace panties", "Thong", "G-string", "Bikini briefs",
     "Cheeky briefs", "High-waisted panties", "Satin panties",
     "Sheer panties", "Strappy panties", "Garter belt",
     "Suspender belt", "Thigh garters", "Stockings",
     "Fishnet stockings", "Thigh-highs", "Hold-up stockings",
     "Bodystocking", "Sheer tights", "Fishnet tights",
-])
+]))
 
-OUTERWEAR = [_UNSET, _RND, _REMOVE] + sorted([
+OUTERWEAR = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "Trench coat", "Wool coat", "Long coat", "Peacoat", "Puffer jacket",
     "Parka", "Bomber jacket", "Denim jacket", "Leather jacket",
     "Moto jacket", "Blazer", "Oversized blazer", "Cardigan",
@@ -683,9 +874,9 @@ OUTERWEAR = [_UNSET, _RND, _REMOVE] + sorted([
     "Faux fur coat", "Cape", "Poncho", "Kimono", "Shawl",
     "Wrap coat", "Duster coat", "Belted coat", "Suit jacket",
     "Satin robe",
-])
+]))
 
-SHOES = [_UNSET, _RND, _REMOVE] + sorted([
+SHOES = OptionList([_UNSET, _RND, _REMOVE] + sorted([
     "Sneakers", "Boots", "Heels", "Platform shoes", "Sandals", "Flats",
     "Strappy heels", "Stilettos", "Pumps", "Wedges", "Ankle boots",
     "Knee-high boots", "Thigh-high boots", "Combat boots",
@@ -693,9 +884,9 @@ SHOES = [_UNSET, _RND, _REMOVE] + sorted([
     "Gladiator sandals", "Mules", "Slides", "Ballet flats",
     "Cowboy boots", "Pointed-toe heels", "Clear heels",
     "Lace-up heels", "Thigh-high heeled boots", "Barefoot",
-])
+]))
 
-CLOTHING_COLORS = [_UNSET, _RND] + sorted([
+CLOTHING_COLORS = OptionList([_UNSET, _RND] + sorted([
     "black", "white", "cream", "ivory", "beige", "tan", "camel",
     "brown", "chocolate", "cognac", "burgundy", "maroon", "wine",
     "red", "cherry", "coral", "salmon", "pink", "hot pink", "blush",
@@ -708,9 +899,9 @@ CLOTHING_COLORS = [_UNSET, _RND] + sorted([
     "metallic gold", "metallic silver", "rose gold",
     "denim blue", "pastel", "neon", "tie-dye", "camo",
     "leopard print", "plaid", "striped", "floral",
-])
+]))
 
-ACCESSORIES = [_UNSET, _RND] + sorted([
+ACCESSORIES = OptionList([_UNSET, _RND] + sorted([
     "Belt", "Chain belt", "Sunglasses", "Eyeglasses", "Beanie",
     "Baseball cap", "Handbag", "Backpack", "Headphones", "Watch",
     "Choker", "Leather choker", "Spiked choker", "Body harness",
@@ -720,13 +911,348 @@ ACCESSORIES = [_UNSET, _RND] + sorted([
     "Nose ring", "Septum ring", "Body chain", "Waist chain",
     "Scarf", "Silk scarf", "Necktie", "Bow tie", "Bracelets",
     "Anklet", "Clutch bag", "Tote bag",
-])
+]))
+
+# ──────────────────────────────────────────────
+# Fields that accept "random", with their vocabularies
+# ──────────────────────────────────────────────
+RANDOM_FIELDS = {
+    "pose": POSES,
+    "scene_type": SCENE_TYPES,
+    "shot_type": SHOT_TYPES,
+    "camera_angle": CAMERA_ANGLES,
+    "lighting_setup": LIGHTING_SETUPS,
+    "photo_style": PHOTO_STYLES,
+    "lens": LENSES,
+    "depth_of_field": DEPTH_OF_FIELD,
+    "color_grading": COLOR_GRADINGS,
+    "hairstyle": HAIRSTYLES,
+    "hair_color": HAIR_COLORS,
+    "top": TOPS,
+    "top_color": CLOTHING_COLORS,
+    "bottom": BOTTOMS,
+    "bottom_color": CLOTHING_COLORS,
+    "shoes": SHOES,
+    "shoes_color": CLOTHING_COLORS,
+    "lingerie_top": LINGERIE_TOPS,
+    "lingerie_top_color": CLOTHING_COLORS,
+    "lingerie_bottom": LINGERIE_BOTTOMS,
+    "lingerie_bottom_color": CLOTHING_COLORS,
+    "outerwear": OUTERWEAR,
+    "outerwear_color": CLOTHING_COLORS,
+    "accessory_1": ACCESSORIES,
+    "accessory_2": ACCESSORIES,
+    "accessory_3": ACCESSORIES,
+}
+
+for _options in RANDOM_FIELDS.values():
+    _POOLS[id(_options)] = SamplingTable(v for v in _options if v not in _SKIP_RANDOM)
+
+# ──────────────────────────────────────────────
+# Incompatible option pairs: (field_a, values_a, field_b, values_b).
+# Random resolution, batch expansion and spec spaces never combine them;
+# options the user picks explicitly are always honored.
+# ──────────────────────────────────────────────
+_MOBILE_POSES = [
+    "walking", "walking mid-step turn", "twirl", "dance step", "small jump",
+    "stretch overhead", "yoga warrior pose",
+]
+_FURNITURE_POSES = ["sitting couch lounge", "reclining on sofa"]
+_OUTDOOR_SCENES = ["urban street", "beach", "pool", "park", "rooftop", "balcony"]
+
+INCOMPATIBLE_OPTIONS = [
+    # Poses that don't fit the location
+    ("pose", _MOBILE_POSES + ["lying on back", "lying on stomach elbows up", "leaning in doorway",
+                              "leaning on railing", "sitting on stairs", "crouching", "squatting"],
+     "scene_type", "car"),
+    ("pose", _FURNITURE_POSES, "scene_type", _OUTDOOR_SCENES + ["stairwell", "hallway/corridor", "car"]),
+    ("pose", "sitting on stairs", "scene_type", ["beach", "pool", "bathroom"]),
+    ("pose", "mirror selfie pose", "scene_type", ["beach", "pool", "park", "urban street", "car"]),
+    # Poses that don't fit the framing
+    ("pose", ["back to camera", "over the shoulder look"], "shot_type",
+     ["extreme close-up", "close-up face", "selfie arm-length"]),
+    ("pose", _MOBILE_POSES, "shot_type", ["extreme close-up", "close-up face", "headshot"]),
+    ("pose", "mirror selfie pose", "shot_type", ["from-behind candid", "silhouette framing", "wide full-body"]),
+    # Framing vs lens / angle / style
+    ("shot_type", "selfie arm-length", "lens",
+     ["24mm wide", "85mm portrait", "105mm", "135mm", "iPhone rear camera"]),
+    ("shot_type", "selfie arm-length", "camera_angle", ["from below", "rear 3/4 angle", "low-angle hero shot"]),
+    ("shot_type", "selfie arm-length", "photo_style", ["paparazzi", "documentary candid", "street style"]),
+    ("shot_type", "extreme close-up", "lens", ["24mm wide", "iPhone front camera"]),
+    ("shot_type", "wide full-body", "lens", ["105mm", "135mm", "iPhone front camera"]),
+    ("shot_type", "from-behind candid", "camera_angle", ["mirror selfie angle", "overhead selfie angle"]),
+    ("camera_angle", ["mirror selfie angle", "overhead selfie angle"], "lens",
+     ["85mm portrait", "105mm", "135mm", "iPhone rear camera"]),
+    ("photo_style", "mirror selfie", "lens", ["85mm portrait", "105mm", "135mm", "iPhone front camera"]),
+    ("photo_style", "paparazzi", "lens", ["iPhone front camera"]),
+    # Lighting that can't exist in the location
+    ("lighting_setup", ["golden hour", "blue hour", "harsh midday sun", "backlit sun flare"],
+     "scene_type", ["studio", "stairwell", "hallway/corridor"]),
+    ("lighting_setup", ["harsh midday sun", "backlit sun flare"], "scene_type", "bar/club"),
+    ("lighting_setup", "screen/monitor glow", "scene_type", ["beach", "pool", "park", "rooftop"]),
+    ("lighting_setup", "candlelight", "scene_type", ["beach", "pool", "gym", "urban street", "park"]),
+]
+
+# ──────────────────────────────────────────────
+# Outfit compatibility: slot pairs that clash.
+# Same (field_a, values_a, field_b, values_b) form.
+# ──────────────────────────────────────────────
+_HEAVY_COATS = [
+    "Trench coat", "Wool coat", "Long coat", "Peacoat", "Puffer jacket", "Parka",
+    "Faux fur coat", "Duster coat", "Wrap coat", "Belted coat",
+]
+_SPORTY_BOTTOMS = ["Joggers", "Sweatpants", "Track pants", "Yoga pants", "Biker shorts"]
+_DRESSY_TOPS = [
+    "Corset", "Corset top", "Bustier", "Lace camisole", "Satin camisole",
+    "Sheer blouse", "Chiffon blouse", "Gothic lace top",
+]
+_DRESSY_HEELS = [
+    "Stilettos", "Pumps", "Pointed-toe heels", "Strappy heels", "Lace-up heels",
+    "Clear heels", "Platform heels",
+]
+_WIDE_PANTS = ["Wide-leg pants", "Palazzo pants", "Bell bottoms", "Flare pants", "Sweatpants", "Track pants"]
+_TALL_BOOTS = ["Knee-high boots", "Thigh-high boots", "Thigh-high heeled boots", "Cowboy boots"]
+_LEGWEAR = [
+    "Stockings", "Fishnet stockings", "Thigh-highs", "Hold-up stockings",
+    "Bodystocking", "Sheer tights", "Fishnet tights",
+]
+
+OUTFIT_INCOMPATIBLE = [
+    # One-piece tops over bulky or sporty bottoms
+    ("top", "Bodysuit", "bottom", ["High-waisted jeans", "Cargo pants"] + _SPORTY_BOTTOMS),
+    ("top", _DRESSY_TOPS, "bottom", _SPORTY_BOTTOMS),
+    ("bottom", _SPORTY_BOTTOMS, "shoes", _DRESSY_HEELS),
+    # The same garment twice
+    ("top", ["Cardigan", "Cropped cardigan", "Bolero shrug"], "outerwear", ["Cardigan", "Long cardigan"]),
+    ("top", ["Hoodie", "Cropped hoodie"], "outerwear", ["Zip hoodie", "Blazer", "Oversized blazer", "Suit jacket"]),
+    ("bottom", ["Leggings", "Fishnet leggings", "Yoga pants"], "lingerie_bottom", _LEGWEAR),
+    # Winter coats with beachwear footwear and lingerie-only layers
+    ("outerwear", _HEAVY_COATS, "shoes", ["Slides", "Sandals", "Strappy sandals", "Gladiator sandals", "Barefoot"]),
+    ("outerwear", _HEAVY_COATS + ["Moto jacket", "Windbreaker"], "lingerie_top",
+     ["Babydoll top", "Teddy lingerie", "Cage bra", "Harness bra"]),
+    ("outerwear", "Satin robe", "shoes", ["Sneakers", "Boots", "Combat boots", "Heeled boots"] + _TALL_BOOTS),
+    ("outerwear", "Satin robe", "bottom", ["Jeans", "Ripped jeans", "Skinny jeans", "High-waisted jeans",
+                                           "Cargo pants", "Slacks"] + _SPORTY_BOTTOMS),
+    # Tall boots can't go over wide hems
+    ("bottom", _WIDE_PANTS, "shoes", _TALL_BOOTS),
+]
+
+# ──────────────────────────────────────────────
+# Colour harmony (optional): colours pair when they
+# share a group; neutrals go with everything and
+# patterns go with anything but another pattern
+# ──────────────────────────────────────────────
+NEUTRAL_COLORS = [
+    "black", "white", "cream", "ivory", "beige", "tan", "camel", "charcoal",
+    "gray", "light gray", "denim blue", "khaki",
+]
+PATTERN_COLORS = ["leopard print", "plaid", "striped", "floral", "camo", "tie-dye"]
+COLOR_HARMONY_GROUPS = {
+    "earth": ["brown", "chocolate", "cognac", "olive", "army green", "rust", "burnt orange",
+              "mustard", "sage", "forest green", "hunter green"],
+    "warm": ["red", "cherry", "coral", "salmon", "orange", "rust", "burnt orange", "peach",
+             "mustard", "gold", "yellow", "lemon", "burgundy", "maroon", "wine"],
+    "cool": ["navy", "royal blue", "cobalt", "baby blue", "sky blue", "teal", "turquoise", "aqua",
+             "mint", "sage", "lavender", "lilac", "purple", "plum", "violet", "emerald"],
+    "pastel": ["blush", "pink", "baby blue", "sky blue", "mint", "lavender", "lilac", "peach",
+               "lemon", "mauve", "pastel"],
+    "jewel": ["emerald", "royal blue", "cobalt", "plum", "burgundy", "wine", "purple", "violet",
+              "teal", "hunter green", "gold", "metallic gold"],
+    "romantic": ["pink", "hot pink", "blush", "mauve", "red", "cherry", "burgundy", "wine",
+                 "rose gold", "plum"],
+    "metallic": ["gold", "silver", "metallic gold", "metallic silver", "rose gold"],
+    "bold": ["neon", "hot pink", "lemon", "cobalt", "orange", "red", "tie-dye"],
+}
+COLOR_SLOTS = ("top_color", "bottom_color", "shoes_color", "lingerie_top_color",
+               "lingerie_bottom_color", "outerwear_color")
+
+
+def _color_harmony_rules():
+    """Expand COLOR_HARMONY_GROUPS into pairwise rules between colour slots."""
+    groups = {}
+    for name, colors in COLOR_HARMONY_GROUPS.items():
+        for color in colors:
+            groups.setdefault(color, set()).add(name)
+    neutral = set(NEUTRAL_COLORS)
+    patterns = set(PATTERN_COLORS)
+    colors = [c for c in CLOTHING_COLORS if c not in _SKIP_RANDOM]
+
+    def harmonizes(a, b):
+        if a == b or a in neutral or b in neutral:
+            return True
+        if a in patterns or b in patterns:
+            return not (a in patterns and b in patterns)
+        return bool(groups.get(a, set()) & groups.get(b, set()))
+
+    clashes = {a: [b for b in colors if not harmonizes(a, b)] for a in colors}
+    rules = []
+    for i, slot_a in enumerate(COLOR_SLOTS):
+        for slot_b in COLOR_SLOTS[i + 1:]:
+            rules.extend((slot_a, a, slot_b, bad) for a, bad in clashes.items() if bad)
+    return rules
+
+
+COLOR_HARMONY_RULES = _color_harmony_rules()
+
+_RULES = Constraints(RANDOM_FIELDS, INCOMPATIBLE_OPTIONS + OUTFIT_INCOMPATIBLE)
+_HARMONY_RULES = Constraints(RANDOM_FIELDS, INCOMPATIBLE_OPTIONS + OUTFIT_INCOMPATIBLE + COLOR_HARMONY_RULES)
+
+
+def outfit_rules(color_harmony=False):
+    """Constraints for outfit slots, with or without colour harmony."""
+    return _HARMONY_RULES if color_harmony else _RULES
+
+
+@functools.lru_cache(maxsize=16)
+def _weight_tables(random_weights):
+    """Compile a random_weights JSON string into per-field SamplingTables.
+    Cached per string, so repeated executions never rebuild the tables."""
+    tables = {}
+    for field, field_weights in parse_weight_spec(random_weights).items():
+        if field not in RANDOM_FIELDS:
+            raise ValueError(f"random_weights: unknown field '{field}'")
+        tables[field] = SamplingTable(_pool(RANDOM_FIELDS[field]).options, field_weights)
+    return tables
+
+
+# Prompt Builder dropdowns that make up the default combination space
+PROMPT_SPACE_FIELDS = (
+    "pose",
+    "scene_type",
+    "shot_type",
+    "camera_angle",
+    "lighting_setup",
+    "photo_style",
+    "lens",
+    "depth_of_field",
+    "color_grading",
+    "hairstyle",
+    "hair_color",
+)
+
+
+def parse_space_fields(text):
+    """Comma-separated field names -> validated tuple (empty -> all fields)."""
+    fields = tuple(f.strip() for f in (text or "").split(",") if f.strip())
+    unknown = [f for f in fields if f not in PROMPT_SPACE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown spec fields: {', '.join(unknown)}. "
+                         f"Choose from: {', '.join(PROMPT_SPACE_FIELDS)}")
+    return fields or PROMPT_SPACE_FIELDS
+
+
+@functools.lru_cache(maxsize=32)
+def prompt_spec_space(fields=PROMPT_SPACE_FIELDS, constrained=True):
+    """SpecSpace over the concrete options of the given Prompt Builder fields.
+    constrained: leave out INCOMPATIBLE_OPTIONS combinations."""
+    rules = INCOMPATIBLE_OPTIONS if constrained else ()
+    return SpecSpace(((field, _pool(RANDOM_FIELDS[field]).options) for field in fields), rules)
+
+
+OUTFIT_SLOTS = (
+    "top", "top_color", "bottom", "bottom_color", "shoes", "shoes_color",
+    "lingerie_top", "lingerie_top_color", "lingerie_bottom", "lingerie_bottom_color",
+    "outerwear", "outerwear_color", "accessory_1", "accessory_2", "accessory_3",
+)
+
+
+def describe_outfit(
+    top=_UNSET,
+    top_color=_UNSET,
+    bottom=_UNSET,
+    bottom_color=_UNSET,
+    shoes=_UNSET,
+    shoes_color=_UNSET,
+    lingerie_top=_UNSET,
+    lingerie_top_color=_UNSET,
+    lingerie_bottom=_UNSET,
+    lingerie_bottom_color=_UNSET,
+    outerwear=_UNSET,
+    outerwear_color=_UNSET,
+    accessory_1=_UNSET,
+    accessory_2=_UNSET,
+    accessory_3=_UNSET,
+    extra_outfit_details="",
+):
+    """Natural outfit prose from resolved (non-random) slot selections."""
+    pieces = []
+    removed = []
+    _skip = {_UNSET, _REMOVE, _RND}
+
+    def _with_color(item, color):
+        """Prepend color to item if color is set, e.g. 'red t-shirt'."""
+        if color and color not in _skip:
+            return f"{color} {item.lower()}"
+        return item.lower()
+
+    # Gather clothing pieces, track removals
+    for label, item, color in [
+        ("lingerie top", lingerie_top, lingerie_top_color),
+        ("lingerie bottom", lingerie_bottom, lingerie_bottom_color),
+        ("top", top, top_color),
+        ("bottom", bottom, bottom_color),
+        ("outerwear", outerwear, outerwear_color),
+        ("shoes", shoes, shoes_color),
+    ]:
+        if item == _REMOVE:
+            removed.append(label)
+        elif item and item not in _skip:
+            pieces.append(_with_color(item, color))
+
+    # Accessories (no remove option — just unset or pick)
+    seen_acc = set()
+    for item in [accessory_1, accessory_2, accessory_3]:
+        if item and item not in _skip and item.lower() not in seen_acc:
+            pieces.append(item.lower())
+            seen_acc.add(item.lower())
+
+    if not pieces and not removed and not (extra_outfit_details and extra_outfit_details.strip()):
+        return ""
+
+    # Build natural prose
+    if pieces:
+        if len(pieces) == 1:
+            outfit_str = f"Wearing {pieces[0]}"
+        elif len(pieces) == 2:
+            outfit_str = f"Wearing {pieces[0]} and {pieces[1]}"
+        else:
+            outfit_str = f"Wearing {', '.join(pieces[:-1])}, and {pieces[-1]}"
+    else:
+        outfit_str = ""
+
+    # Append removal instructions
+    if removed:
+        without_str = "without " + ", without ".join(removed)
+        if outfit_str:
+            outfit_str = f"{outfit_str}, {without_str}"
+        else:
+            outfit_str = without_str.capitalize()
+
+    if extra_outfit_details and extra_outfit_details.strip():
+        extra = extra_outfit_details.strip()
+        if outfit_str:
+            outfit_str = f"{outfit_str}. {extra}"
+        else:
+            outfit_str = extra
+
+    return outfit_str
+
+
+@functools.lru_cache(maxsize=32)
+def outfit_spec_space(axes, color_harmony=False):
+    """SpecSpace over ((slot, options), ...) restricted to compatible outfits
+    (OUTFIT_INCOMPATIBLE, plus colour harmony if asked). Garment and colour
+    rules never mix, so colour axes go last: interleaving them would multiply
+    the constrained counter's states instead of adding them."""
+    axes = sorted(axes, key=lambda axis: axis[0] in COLOR_SLOTS)
+    return SpecSpace(axes, outfit_rules(color_harmony).rules)
 
 
 class KPPBOutfitComposer:
     """Compose outfit descriptions from categorical selections."""
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return {
             "required": {
@@ -748,9 +1274,20 @@ class KPPBOutfitComposer:
                 "accessory_2": (ACCESSORIES, {"default": _UNSET}),
                 "accessory_3": (ACCESSORIES, {"default": _UNSET}),
                 "extra_outfit_details": ("STRING", {"multiline": True, "default": ""}),
+                "seed": ("INT", {"default": -1, "min": -1, "max": 2147483647,
+                                 "tooltip": "Seed for 'random' selections. -1 picks fresh values every run"}),
+                "random_weights": ("STRING", {"multiline": True, "default": "",
+                                              "placeholder": '{"top_color": {"black": 3, "neon": 0}}',
+                                              "tooltip": "Per-field weights for 'random' selections (JSON). Weight 0 excludes an option"}),
+                "color_harmony": ("BOOLEAN", {"default": False,
+                                              "tooltip": "Random colours only pair with harmonizing colours (shared palette group, neutrals, one pattern at most)"}),
             },
         }
 
+    @classmethod
+    def IS_CHANGED(cls, seed=-1, **kwargs):
+        return _inputs_hash(seed, kwargs)
+
     RETURN_TYPES = ("STRING",)
     RETURN_NAMES = ("outfit",)
     FUNCTION = "compose_outfit"
@@ -774,92 +1311,49 @@ class KPPBOutfitComposer:
         accessory_2=_UNSET,
         accessory_3=_UNSET,
         extra_outfit_details="",
+        seed=-1,
+        random_weights="",
+        color_harmony=False,
     ):
-        # Resolve random selections
-        top = _resolve_random(top, TOPS)
-        top_color = _resolve_random(top_color, CLOTHING_COLORS)
-        bottom = _resolve_random(bottom, BOTTOMS)
-        bottom_color = _resolve_random(bottom_color, CLOTHING_COLORS)
-        shoes = _resolve_random(shoes, SHOES)
-        shoes_color = _resolve_random(shoes_color, CLOTHING_COLORS)
-        lingerie_top = _resolve_random(lingerie_top, LINGERIE_TOPS)
-        lingerie_top_color = _resolve_random(lingerie_top_color, CLOTHING_COLORS)
-        lingerie_bottom = _resolve_random(lingerie_bottom, LINGERIE_BOTTOMS)
-        lingerie_bottom_color = _resolve_random(lingerie_bottom_color, CLOTHING_COLORS)
-        outerwear = _resolve_random(outerwear, OUTERWEAR)
-        outerwear_color = _resolve_random(outerwear_color, CLOTHING_COLORS)
-        accessory_1 = _resolve_random(accessory_1, ACCESSORIES)
-        accessory_2 = _resolve_random(accessory_2, ACCESSORIES)
-        accessory_3 = _resolve_random(accessory_3, ACCESSORIES)
-
-        pieces = []
-        removed = []
-        _skip = {_UNSET, _REMOVE, _RND}
-
-        def _with_color(item, color):
-            """Prepend color to item if color is set, e.g. 'red t-shirt'."""
-            if color and color not in _skip:
-                return f"{color} {item.lower()}"
-            return item.lower()
-
-        # Gather clothing pieces, track removals
-        for label, item, color in [
-            ("lingerie top", lingerie_top, lingerie_top_color),
-            ("lingerie bottom", lingerie_bottom, lingerie_bottom_color),
-            ("top", top, top_color),
-            ("bottom", bottom, bottom_color),
-            ("outerwear", outerwear, outerwear_color),
-            ("shoes", shoes, shoes_color),
-        ]:
-            if item == _REMOVE:
-                removed.append(label)
-            elif item and item not in _skip:
-                pieces.append(_with_color(item, color))
-
-        # Accessories (no remove option — just unset or pick)
-        seen_acc = set()
-        for item in [accessory_1, accessory_2, accessory_3]:
-            if item and item not in _skip and item.lower() not in seen_acc:
-                pieces.append(item.lower())
-                seen_acc.add(item.lower())
-
-        if not pieces and not removed and not (extra_outfit_details and extra_outfit_details.strip()):
-            return ("",)
-
-        # Build natural prose
-        if pieces:
-            if len(pieces) == 1:
-                outfit_str = f"Wearing {pieces[0]}"
-            elif len(pieces) == 2:
-                outfit_str = f"Wearing {pieces[0]} and {pieces[1]}"
-            else:
-                outfit_str = f"Wearing {', '.join(pieces[:-1])}, and {pieces[-1]}"
-        else:
-            outfit_str = ""
-
-        # Append removal instructions
-        if removed:
-            without_str = "without " + ", without ".join(removed)
-            if outfit_str:
-                outfit_str = f"{outfit_str}, {without_str}"
-            else:
-                outfit_str = without_str.capitalize()
-
-        if extra_outfit_details and extra_outfit_details.strip():
-            extra = extra_outfit_details.strip()
-            if outfit_str:
-                outfit_str = f"{outfit_str}. {extra}"
-            else:
-                outfit_str = extra
-
-        return (outfit_str,)
+        # Resolve random selections (only compatible with the other slots)
+        weights = _weight_tables(random_weights)
+        rules = outfit_rules(color_harmony)
+        chosen = {
+            "top": top, "top_color": top_color, "bottom": bottom, "bottom_color": bottom_color,
+            "shoes": shoes, "shoes_color": shoes_color, "lingerie_top": lingerie_top,
+            "lingerie_top_color": lingerie_top_color, "lingerie_bottom": lingerie_bottom,
+            "lingerie_bottom_color": lingerie_bottom_color, "outerwear": outerwear,
+            "outerwear_color": outerwear_color,
+        }
+        top = _resolve_random(top, TOPS, seed, "top", weights, chosen, rules)
+        top_color = _resolve_random(top_color, CLOTHING_COLORS, seed, "top_color", weights, chosen, rules)
+        bottom = _resolve_random(bottom, BOTTOMS, seed, "bottom", weights, chosen, rules)
+        bottom_color = _resolve_random(bottom_color, CLOTHING_COLORS, seed, "bottom_color", weights, chosen, rules)
+        shoes = _resolve_random(shoes, SHOES, seed, "shoes", weights, chosen, rules)
+        shoes_color = _resolve_random(shoes_color, CLOTHING_COLORS, seed, "shoes_color", weights, chosen, rules)
+        lingerie_top = _resolve_random(lingerie_top, LINGERIE_TOPS, seed, "lingerie_top", weights, chosen, rules)
+        lingerie_top_color = _resolve_random(lingerie_top_color, CLOTHING_COLORS, seed, "lingerie_top_color", weights, chosen, rules)
+        lingerie_bottom = _resolve_random(lingerie_bottom, LINGERIE_BOTTOMS, seed, "lingerie_bottom", weights, chosen, rules)
+        lingerie_bottom_color = _resolve_random(lingerie_bottom_color, CLOTHING_COLORS, seed, "lingerie_bottom_color", weights, chosen, rules)
+        outerwear = _resolve_random(outerwear, OUTERWEAR, seed, "outerwear", weights, chosen, rules)
+        outerwear_color = _resolve_random(outerwear_color, CLOTHING_COLORS, seed, "outerwear_color", weights, chosen, rules)
+        accessory_1 = _resolve_random(accessory_1, ACCESSORIES, seed, "accessory_1", weights)
+        accessory_2 = _resolve_random(accessory_2, ACCESSORIES, seed, "accessory_2", weights)
+        accessory_3 = _resolve_random(accessory_3, ACCESSORIES, seed, "accessory_3", weights)
+
+        return (describe_outfit(
+            top, top_color, bottom, bottom_color, shoes, shoes_color,
+            lingerie_top, lingerie_top_color, lingerie_bottom, lingerie_bottom_color,
+            outerwear, outerwear_color, accessory_1, accessory_2, accessory_3,
+            extra_outfit_details,
+        ),)
 
 
 # ══════════════════════════════════════════════
 # IMAGE EDIT COMPOSER
 # ══════════════════════════════════════════════
 
-EDIT_TYPES = [
+EDIT_TYPES = OptionList([
     "add element",
     "remove element",
     "replace element",
@@ -870,7 +1364,7 @@ EDIT_TYPES = [
     "change makeup",
     "add effect",
     "custom",
-]
+])
 
 IG_QUICK_EFFECTS = {
     "none": "",
@@ -890,7 +1384,34 @@ IG_QUICK_EFFECTS = {
     "add motion blur": "Add subtle motion blur suggesting movement and energy",
 }
 
-IG_QUICK_EFFECT_LIST = list(IG_QUICK_EFFECTS.keys())
+IG_QUICK_EFFECT_LIST = OptionList(IG_QUICK_EFFECTS)
+
+
+def _change_environment(target, value, loc):
+    if target and value:
+        return f"Change {target} to {value}"
+    return f"Change the environment to {value}" if value else ""
+
+
+def _change_outfit(target, value, loc):
+    if target and value:
+        return f"Replace {target} with {value}"
+    return f"Change the outfit to {value}" if value else ""
+
+
+# edit_type -> handler(target, value, location_suffix), all fields stripped
+EDIT_HANDLERS = {
+    "add element": lambda target, value, loc: f"Add {value}{loc}" if value else "",
+    "remove element": lambda target, value, loc: f"Remove {target}{loc}" if target else "",
+    "replace element": lambda target, value, loc: f"Replace {target} with {value}{loc}" if target and value else "",
+    "change style": lambda target, value, loc: f"Turn into {value} style" if value else "",
+    "change environment": _change_environment,
+    "change outfit": _change_outfit,
+    "change hair": lambda target, value, loc: f"Change the hair to {value}" if value else "",
+    "change makeup": lambda target, value, loc: f"Change the makeup to {value}" if value else "",
+    "add effect": lambda target, value, loc: f"Add {value}{loc}" if value else "",
+    "custom": lambda target, value, loc: value,
+}
 
 
 def _compose_single_edit(edit_type, target, value, location):
@@ -898,42 +1419,60 @@ def _compose_single_edit(edit_type, target, value, location):
     target = target.strip() if target else ""
     value = value.strip() if value else ""
     location = location.strip() if location else ""
-    loc_suffix = f" {location}" if location else ""
-
     if not target and not value:
         return ""
+    handler = EDIT_HANDLERS.get(edit_type)
+    return handler(target, value, f" {location}" if location else "") if handler else ""
+
+
+def parse_edit_record(record):
+    """Edit record -> {"type", "target", "value", "location"}.
+    Accepts a dict, a JSON object string, or plain text (a "custom" edit,
+    e.g. an Image Edit List entry)."""
+    if isinstance(record, str):
+        text = record.strip()
+        if not text.startswith("{"):
+            return {"type": "custom", "target": "", "value": text, "location": ""}
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Edit record is not valid JSON: {e}") from e
+    if not isinstance(record, dict):
+        raise ValueError(f"Edit records must be objects or text, got {type(record).__name__}")
+    edit_type = record.get("type", "custom")
+    if edit_type not in EDIT_HANDLERS:
+        raise ValueError(f"Unknown edit type '{edit_type}'. Choose from: {', '.join(EDIT_TYPES)}")
+    return {"type": edit_type,
+            **{k: str(record.get(k) or "") for k in ("target", "value", "location")}}
+
+
+def effect_prose(effect):
+    """IG quick effect name ("add rain") or ready-made prose -> sentence."""
+    effect = (effect or "").strip()
+    return IG_QUICK_EFFECTS.get(effect, IG_QUICK_EFFECTS.get(effect.lower(), effect))
+
+
+def _edit_tail(preserve_identity, preserve_note):
+    """Closing sentences of an edit prompt: preservation note + identity lock."""
+    tail = []
+    if preserve_note and preserve_note.strip():
+        note = preserve_note.strip()
+        lower = note.lower()
+        if not any(lower.startswith(p) for p in ("keep ", "preserve ", "maintain ", "don't ", "do not ")):
+            tail.append(f"Keep {note}")
+        else:
+            tail.append(note[0].upper() + note[1:])
+    if preserve_identity:
+        tail.append(IDENTITY_LOCK_PROMPT)
+    return tail
 
-    if edit_type == "add element":
-        return f"Add {value}{loc_suffix}" if value else ""
-    elif edit_type == "remove element":
-        return f"Remove {target}{loc_suffix}" if target else ""
-    elif edit_type == "replace element":
-        if target and value:
-            return f"Replace {target} with {value}{loc_suffix}"
-        return ""
-    elif edit_type == "change style":
-        return f"Turn into {value} style" if value else ""
-    elif edit_type == "change environment":
-        if target and value:
-            return f"Change {target} to {value}"
-        elif value:
-            return f"Change the environment to {value}"
-        return ""
-    elif edit_type == "change outfit":
-        if target and value:
-            return f"Replace {target} with {value}"
-        elif value:
-            return f"Change the outfit to {value}"
-        return ""
-    elif edit_type == "change hair":
-        return f"Change the hair to {value}" if value else ""
-    elif edit_type == "change makeup":
-        return f"Change the makeup to {value}" if value else ""
-    elif edit_type == "add effect":
-        return f"Add {value}{loc_suffix}" if value else ""
-    elif edit_type == "custom":
-        return value
-    return ""
+
+def join_edit(instructions):
+    """Instruction sentences -> one edit prompt ending in a period."""
+    edit_prompt = ". ".join(instructions)
+    if edit_prompt and not edit_prompt.endswith("."):
+        edit_prompt += "."
+    return edit_prompt
 
 
 class KPPBImageEditComposer:
@@ -941,6 +1480,7 @@ class KPPBImageEditComposer:
     Supports 3 stacked edit slots + IG quick effects."""
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return {
             "required": {
@@ -1007,26 +1547,13 @@ class KPPBImageEditComposer:
                 instructions.append(inst)
 
         # IG quick effect
-        effect_prose = IG_QUICK_EFFECTS.get(ig_quick_effect, "")
-        if effect_prose:
-            instructions.append(effect_prose)
-
-        # Preservation note
-        if preserve_note and preserve_note.strip():
-            note = preserve_note.strip()
-            lower = note.lower()
-            if not any(lower.startswith(p) for p in ("keep ", "preserve ", "maintain ", "don't ", "do not ")):
-                instructions.append(f"Keep {note}")
-            else:
-                instructions.append(note[0].upper() + note[1:])
-
-        # Identity preservation
-        if preserve_identity:
-            instructions.append(IDENTITY_LOCK_PROMPT)
-
-        edit_prompt = ". ".join(instructions)
-        if edit_prompt and not edit_prompt.endswith("."):
-            edit_prompt += "."
+        effect = IG_QUICK_EFFECTS.get(ig_quick_effect, "")
+        if effect:
+            instructions.append(effect)
+
+        # Preservation note + identity preservation
+        instructions.extend(_edit_tail(preserve_identity, preserve_note))
+        edit_prompt = join_edit(instructions)
 
         # JSON output
         edit_data = {
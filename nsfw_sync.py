@@ -0,0 +1,210 @@
+"""
+NSFW module synchronization, kept off the import path.
+config.json decides whether nsfw_pack/ should be populated. Bringing the
+folder in line needs git (and the network, for a fetch), so the node pack
+only starts sync_in_background() at import: a daemon thread with a strict
+time budget that ComfyUI never waits on. `python -m kppb sync` runs the same
+sync in the foreground. Every run records its outcome in .kppb_sync.json.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from .config import load_config
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+NSFW_DIR = os.path.join(_DIR, "nsfw_pack")
+NSFW_REPO = "https://github.com/artokun/ComfyUI-Photoreal-Prompt-Builder-NSFW.git"
+STATUS_PATH = os.path.join(_DIR, ".kppb_sync.json")
+_LOCK_PATH = os.path.join(_DIR, ".kppb_sync.lock")
+
+# Headless workers: git must fail rather than wait for credentials
+_GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+
+
+def nsfw_populated():
+    """Check if nsfw_pack/ has Python files (not just .git metadata)."""
+    if not os.path.isdir(NSFW_DIR):
+        return False
+    return any(f.endswith(".py") for f in os.listdir(NSFW_DIR))
+
+
+def _is_git_repo():
+    """Check if the node pack was installed as a git repo (clone) vs zip."""
+    return os.path.isdir(os.path.join(_DIR, ".git"))
+
+
+def sync_action(config=None):
+    """"fetch", "clean", or None when nsfw_pack/ already matches config.json."""
+    enabled = bool((config or load_config()).get("nsfw", False))
+    populated = nsfw_populated()
+    if enabled and not populated:
+        return "fetch"
+    if not enabled and populated:
+        return "clean"
+    return None
+
+
+# ══════════════════════════════════════════════
+# GIT OPERATIONS
+# ══════════════════════════════════════════════
+
+def _git(args, deadline, check=True):
+    """Run git in the pack folder, killed at the shared deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise subprocess.TimeoutExpired(["git", *args], 0)
+    proc = subprocess.run(
+        ["git", *args], cwd=_DIR, env=_GIT_ENV, stdin=subprocess.DEVNULL,
+        capture_output=True, text=True, timeout=remaining,
+    )
+    if check and proc.returncode:
+        detail = (proc.stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]
+        raise RuntimeError(f"git {args[0]} failed: {detail}")
+
+
+def _fetch(deadline):
+    """Fetch the nsfw_pack module. Uses git submodule if available,
+    otherwise falls back to a direct clone (for zip/tarball installs)."""
+    if _is_git_repo():
+        _git(["submodule", "update", "--init", "--", "nsfw_pack"], deadline)
+    else:
+        # Clone beside nsfw_pack/ and swap it in, so a clone cut off by the
+        # budget never leaves a half-populated module behind
+        partial = NSFW_DIR + ".partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            _git(["clone", NSFW_REPO, partial], deadline)
+            shutil.rmtree(NSFW_DIR, ignore_errors=True)
+            os.replace(partial, NSFW_DIR)
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+    if not nsfw_populated():
+        raise RuntimeError("fetch completed but no Python files found in nsfw_pack/")
+
+
+def _clean(deadline):
+    """Remove nsfw_pack contents. Handles both git submodule and direct clone."""
+    if _is_git_repo():
+        _git(["submodule", "deinit", "-f", "--", "nsfw_pack"], deadline, check=False)
+    if os.path.isdir(NSFW_DIR):
+        shutil.rmtree(NSFW_DIR)
+        os.makedirs(NSFW_DIR, exist_ok=True)
+
+
+# ══════════════════════════════════════════════
+# STATUS MARKER + LOCK
+# ══════════════════════════════════════════════
+
+def read_status():
+    """Last recorded sync status, or None if no sync has run."""
+    try:
+        with open(STATUS_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_status(status):
+    try:
+        tmp = STATUS_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f, indent=2, sort_keys=True)
+        os.replace(tmp, STATUS_PATH)
+    except OSError:
+        pass  # read-only install: the sync result is still printed
+
+
+def _acquire_lock(budget):
+    """One sync per install at a time (workers may share the folder). A lock
+    older than the budget belongs to a dead run and is taken over."""
+    for _ in range(2):
+        try:
+            os.close(os.open(_LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(_LOCK_PATH) < budget:
+                    return False
+                os.remove(_LOCK_PATH)
+            except OSError:
+                pass
+        except OSError:
+            return True  # can't lock a read-only folder; git will report it
+    return False
+
+
+def _release_lock():
+    try:
+        os.remove(_LOCK_PATH)
+    except OSError:
+        pass
+
+
+# ══════════════════════════════════════════════
+# SYNC
+# ══════════════════════════════════════════════
+
+def sync(timeout=None, config=None):
+    """Bring nsfw_pack/ in line with config.json within `timeout` seconds
+    (default: config "sync_timeout"). Returns the status dict that is also
+    written to the marker file; its state is ok, busy, timeout or failed."""
+    config = config or load_config()
+    budget = float(config.get("sync_timeout", 60) if timeout is None else timeout)
+    action = sync_action(config)
+    started = time.time()
+    status = {"action": action, "started": started, "budget": budget}
+
+    if action is None:
+        status.update(state="ok", seconds=0.0, message="nsfw_pack already matches config.json")
+        _write_status(status)
+        return status
+    if not _acquire_lock(budget):
+        # The running sync owns the marker; report without overwriting it
+        status.update(state="busy", seconds=0.0, message="another sync is already running")
+        return status
+
+    _write_status(dict(status, state="running", message=f"{action} in progress"))
+    try:
+        (_fetch if action == "fetch" else _clean)(time.monotonic() + budget)
+        state, message = "ok", "NSFW module fetched" if action == "fetch" else "NSFW module cleaned up"
+    except subprocess.TimeoutExpired:
+        state, message = "timeout", f"{action} exceeded the {budget:g}s budget"
+    except Exception as e:
+        state, message = "failed", f"{type(e).__name__}: {e}"
+    finally:
+        _release_lock()
+    status.update(state=state, seconds=round(time.time() - started, 2), message=message)
+    _write_status(status)
+    return status
+
+
+def sync_in_background(config=None):
+    """Start sync() on a daemon thread if nsfw_pack/ is out of date and
+    config "auto_sync" is on. Never waits; returns the thread or None."""
+    config = config or load_config()
+    action = sync_action(config)
+    if action is None:
+        return None
+    if not config.get("auto_sync", True):
+        print("[KPPB] NSFW module does not match config.json and auto_sync is off. "
+              "Run: python -m kppb sync")
+        return None
+
+    def run():
+        status = sync(config=config)
+        if status["state"] != "ok":
+            print(f"[KPPB] Warning: NSFW {action} {status['state']}: {status['message']}")
+        elif action == "fetch":
+            print("[KPPB] NSFW module fetched successfully. Restart ComfyUI to load its nodes.")
+        else:
+            print("[KPPB] NSFW module cleaned up.")
+
+    print(f"[KPPB] NSFW module does not match config.json. Running {action} in the background.")
+    thread = threading.Thread(target=run, name="kppb-nsfw-sync", daemon=True)
+    thread.start()
+    return thread
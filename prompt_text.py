@@ -0,0 +1,226 @@
+"""
+Free-text helpers for prompt assembly.
+PhraseExpander compiles shorthand -> expansion tables into one Aho-Corasick
+automaton, so every shorthand inside a free-text field is replaced in a
+single linear pass no matter how many entries the tables hold.
+estimate_tokens / trim_sections keep prompts inside the text encoder window.
+PromptCanonicalizer gives prompts a canonical form and a stable hash.
+"""
+
+import functools
+import hashlib
+import json
+import re
+
+
+class PhraseExpander:
+    """Replace every shorthand phrase in a text with its expansion.
+
+    tables: dicts of {shorthand: expansion}; earlier tables win when the same
+    shorthand appears twice. Matching is case-insensitive and only on whole
+    words; overlapping candidates resolve leftmost-longest, so "doggy style"
+    beats "doggy" and the expanded text is never re-scanned."""
+
+    __slots__ = ("phrases", "_goto", "_fail", "_out")
+
+    def __init__(self, *tables):
+        phrases = {}
+        for table in tables:
+            for key, value in table.items():
+                key = key.strip().lower()
+                if key and key not in phrases:
+                    phrases[key] = value
+        self.phrases = phrases
+        self._build()
+
+    def _build(self):
+        goto = [{}]
+        out = [0]  # length of the phrase ending at each node (0 = none)
+        for phrase in self.phrases:
+            node = 0
+            for ch in phrase:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(0)
+                node = nxt
+            out[node] = len(phrase)
+
+        # Breadth-first failure links; each node's output list gathers the
+        # phrase lengths of its whole suffix chain once, at build time
+        fail = [0] * len(goto)
+        outs = [(n,) if n else () for n in out]
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                outs[nxt] = outs[nxt] + outs[fail[nxt]]
+                queue.append(nxt)
+        self._goto = goto
+        self._fail = fail
+        self._out = outs
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def __bool__(self):
+        return bool(self.phrases)
+
+    def expand(self, text):
+        """Text with every whole-word shorthand replaced, in one pass."""
+        if not self.phrases or not text:
+            return text
+        folded = text.lower()
+        if len(folded) != len(text):
+            folded = text  # case folding changed offsets; match as typed
+
+        goto, fail, outs = self._goto, self._fail, self._out
+        longest = {}  # start offset -> longest whole-word match length
+        node = 0
+        n = len(text)
+        for i, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if outs[node] and (i + 1 == n or not text[i + 1].isalnum()):
+                for length in outs[node]:
+                    start = i + 1 - length
+                    if (start == 0 or not text[start - 1].isalnum()) and length > longest.get(start, 0):
+                        longest[start] = length
+        if not longest:
+            return text
+
+        parts = []
+        pos = 0
+        for start in sorted(longest):
+            if start < pos:
+                continue
+            end = start + longest[start]
+            parts.append(text[pos:start])
+            parts.append(self.phrases[folded[start:end]])
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts)
+
+
+def parse_expansions(text):
+    """Parse user expansions from JSON, e.g. {"gh": "golden hour glow"}.
+    Returns {} for empty input."""
+    if not text or not text.strip():
+        return {}
+    try:
+        table = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"custom_expansions is not valid JSON: {e}") from e
+    if not isinstance(table, dict) or not all(isinstance(v, str) for v in table.values()):
+        raise ValueError('custom_expansions must map shorthand -> expansion text, '
+                         'e.g. {"gh": "golden hour glow"}')
+    return table
+
+
+# ──────────────────────────────────────────────
+# Token budget (Klein text encoder: Qwen3 byte-level BPE)
+# ──────────────────────────────────────────────
+
+# Section drop order when a prompt is over max_tokens (first = dropped first)
+TRIM_ORDER = ("mood", "extra", "technical", "hair", "environment", "lighting", "action", "outfit")
+TRIM_SECTIONS = ("opener", "action", "hair", "outfit", "exposure", "environment", "extra",
+                 "lighting", "technical", "mood", "edits", "identity")
+
+# Pre-tokenizer pieces: letter runs, single digits (Qwen splits numbers
+# digit by digit), punctuation runs
+_PIECES = re.compile(r"[^\W\d_]+|\d|[^\w\s]+|_+")
+
+
+@functools.lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """Approximate encoder token count. English words up to 7 letters are one
+    BPE token, longer ones split about every 4 letters; digits and
+    punctuation runs cost one each. Cached, so repeated sections are free."""
+    n = 0
+    for piece in _PIECES.findall(text):
+        k = len(piece)
+        n += 1 + (k - 4) // 4 if k > 7 and piece[0].isalpha() else 1
+    return n
+
+
+@functools.lru_cache(maxsize=32)
+def parse_trim_order(text):
+    """Comma-separated section names -> validated tuple (empty -> TRIM_ORDER)."""
+    order = tuple(s.strip() for s in (text or "").split(",") if s.strip())
+    unknown = [s for s in order if s not in TRIM_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown trim_order sections: {', '.join(unknown)}. "
+                         f"Choose from: {', '.join(TRIM_SECTIONS)}")
+    return order or TRIM_ORDER
+
+
+def trim_sections(sections, max_tokens=0, order=TRIM_ORDER):
+    """sections: ((name, text), ...) in prompt order, empty texts allowed.
+    Drops whole sections in `order` until the estimate fits max_tokens
+    (0 = no limit). Returns (kept texts, estimated tokens of the joined
+    prompt — each sentence separator counts as one token)."""
+    costs = {name: estimate_tokens(text) + 1 for name, text in sections if text}
+    total = sum(costs.values())
+    if max_tokens <= 0 or total <= max_tokens:
+        return [text for _, text in sections if text], total
+    dropped = set()
+    for name in order:
+        if total <= max_tokens:
+            break
+        if name in costs:
+            total -= costs[name]
+            dropped.add(name)
+    return [text for name, text in sections if text and name not in dropped], total
+
+
+# ──────────────────────────────────────────────
+# Canonical form + stable hash
+# ──────────────────────────────────────────────
+
+_WHITESPACE = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([.,;:!?])")
+_REPEATED_STOPS = re.compile(r"([.!?])(?:\s*\.)+")
+_REPEATED_COMMAS = re.compile(r",(?:\s*,)+")
+_TIGHT_COMMA = re.compile(r"([,;])(?=[^\s\d])")
+_SENTENCE_START = re.compile(r"(^|[.!?] )([a-z])")
+
+
+class PromptCanonicalizer:
+    """Canonical form of a prompt, so prompts that differ only in whitespace,
+    sentence separators or the case of known phrases key the same caches.
+
+    phrases: fixed phrases (dropdown options, ...) rewritten to the given
+    spelling wherever they appear in any case."""
+
+    __slots__ = ("_phrases",)
+
+    def __init__(self, phrases=()):
+        self._phrases = PhraseExpander({p: p for p in phrases})
+
+    def canonical(self, text):
+        """Collapsed whitespace, one ". " between sentences, ", " after
+        commas, known phrases in their fixed case, capitalized sentences and
+        a closing period."""
+        text = _WHITESPACE.sub(" ", text or "").strip()
+        if not text:
+            return ""
+        text = _SPACE_BEFORE_PUNCT.sub(r"\1", text)
+        text = _REPEATED_STOPS.sub(r"\1", text)
+        text = _REPEATED_COMMAS.sub(",", text)
+        text = _TIGHT_COMMA.sub(r"\1 ", text)
+        text = self._phrases.expand(text)
+        text = _SENTENCE_START.sub(lambda m: m.group(1) + m.group(2).upper(), text)
+        if text[-1] not in ".!?":
+            text += "."
+        return text
+
+    def hash(self, text, length=16):
+        """Short stable hex digest of the canonical form (same across runs and
+        machines, unlike hash())."""
+        return hashlib.sha256(self.canonical(text).encode("utf-8")).hexdigest()[:length]
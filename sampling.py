@@ -0,0 +1,109 @@
+"""
+Precomputed sampling tables for "random" dropdown resolution.
+Concrete option pools are built once per vocabulary at import; weighted pools
+use Vose's alias method so every draw is O(1) regardless of pool size.
+"""
+
+import json
+
+
+class SamplingTable:
+    """Fixed pool of concrete options with optional per-option weights.
+
+    weights maps option -> relative weight (missing options default to 1.0).
+    A weight of 0 excludes the option from the pool entirely."""
+
+    __slots__ = ("options", "_weights", "_prob", "_alias")
+
+    def __init__(self, options, weights=None):
+        options = list(options)
+        self._weights = None
+        self._prob = None
+        self._alias = None
+        if weights:
+            unknown = [k for k in weights if k not in options]
+            if unknown:
+                raise ValueError(f"Unknown options in weight table: {', '.join(map(str, unknown))}")
+            pairs = [(o, float(weights.get(o, 1.0))) for o in options]
+            options = [o for o, w in pairs if w > 0]
+            w = [w for _, w in pairs if w > 0]
+            if options and len(set(w)) > 1:
+                self._weights = tuple(w)
+                self._prob, self._alias = _build_alias(w)
+        self.options = tuple(options)
+
+    def __len__(self):
+        return len(self.options)
+
+    def __bool__(self):
+        return bool(self.options)
+
+    @property
+    def weighted(self):
+        return self._prob is not None
+
+    @property
+    def weights(self):
+        """{option: weight} of the pool (1.0 each when unweighted)."""
+        return dict(zip(self.options, self._weights or (1.0,) * len(self.options)))
+
+    def draw(self, rng):
+        """Draw one option using the given random.Random stream."""
+        if self._prob is None:
+            return rng.choice(self.options)
+        i = int(rng.random() * len(self.options))
+        return self.options[i] if rng.random() < self._prob[i] else self.options[self._alias[i]]
+
+    def draw_subset(self, rng, allowed):
+        """Draw restricted to the options in `allowed` (a set), keeping their
+        relative weights. Returns None if none of the pool is allowed."""
+        if self._weights is None:
+            options = [o for o in self.options if o in allowed]
+            return rng.choice(options) if options else None
+        pairs = [(o, w) for o, w in zip(self.options, self._weights) if o in allowed]
+        if not pairs:
+            return None
+        return rng.choices([o for o, _ in pairs], weights=[w for _, w in pairs])[0]
+
+    def draw_many(self, rng, k):
+        """Draw k options with replacement."""
+        if self._prob is None:
+            return rng.choices(self.options, k=k)
+        return [self.draw(rng) for _ in range(k)]
+
+
+def _build_alias(weights):
+    """Vose's alias method: O(n) build, O(1) draw."""
+    n = len(weights)
+    total = sum(weights)
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = [0] * n
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s = small.pop()
+        g = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = g
+        scaled[g] = (scaled[g] + scaled[s]) - 1.0
+        (small if scaled[g] < 1.0 else large).append(g)
+    for i in large + small:
+        prob[i] = 1.0
+    return prob, alias
+
+
+def parse_weight_spec(text):
+    """Parse a per-field weight table from JSON, e.g.
+    {"lighting_setup": {"golden hour": 3, "direct flash": 0}}.
+    Returns {} for empty input."""
+    if not text or not text.strip():
+        return {}
+    try:
+        spec = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"random_weights is not valid JSON: {e}") from e
+    if not isinstance(spec, dict) or not all(isinstance(v, dict) for v in spec.values()):
+        raise ValueError('random_weights must map field -> {option: weight}, '
+                         'e.g. {"lighting_setup": {"golden hour": 3}}')
+    return spec
@@ -0,0 +1,178 @@
+"""
+Selection expressions for list nodes.
+A vocabulary is indexed once (folded text + bitmask per match); expressions
+compile once into a tuple of terms and are then evaluated as integer bitmask
+operations, so selecting from hundreds of items costs a few big-int ops.
+
+Terms are separated by newlines or ";" and applied left to right. A leading
+"-" removes the matches instead of adding them ("+" is optional):
+
+    all                 every item (also "*")
+    none                clear the selection
+    3, 5-9              indices and inclusive ranges (0-based)
+    0x3e9               hex bitmask, bit i = item i
+    [2:20:2]            Python slice over the indices
+    /sit|kneel/         regex search (case-insensitive)
+    *chair*             glob (case-insensitive)
+    beach               plain text: items containing it (case-insensitive)
+    random 8 seed 42    keep 8 of the current selection (of all if empty)
+    first 10            keep the first 10 of the current selection (of all if empty)
+
+"-random 3 seed 1" and "-first 2" drop those items from the selection
+instead of keeping only them.
+"""
+
+import fnmatch
+import functools
+import random
+import re
+
+_TERM_SPLIT = re.compile(r"[;\n]")
+_INDICES = re.compile(r"^\d+(\s*-\s*\d+)?(\s*,\s*\d+(\s*-\s*\d+)?)*,?$")
+_SLICE = re.compile(r"^\[\s*(-?\d*)\s*(?::\s*(-?\d*)\s*)?(?::\s*(-?\d*)\s*)?\]$")
+_RANDOM = re.compile(r"^random\s+(\d+)(?:\s+seed\s+(-?\d+))?$", re.IGNORECASE)
+_FIRST = re.compile(r"^(?:first|limit)\s+(\d+)$", re.IGNORECASE)
+
+
+class Vocabulary:
+    """Item list indexed for selection: each term's match mask is computed
+    once per vocabulary and reused by every later evaluation."""
+
+    __slots__ = ("items", "full", "_folded", "_masks")
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        self.full = (1 << len(self.items)) - 1
+        self._folded = tuple(item.lower() for item in self.items)
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def mask(self, kind, arg):
+        """Bitmask of the items matched by a compiled term."""
+        key = (kind, arg)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._match(kind, arg)
+            self._masks[key] = mask
+        return mask
+
+    def _match(self, kind, arg):
+        size = len(self.items)
+        if kind == "all":
+            return self.full
+        if kind == "bits":
+            if arg >> size:
+                raise ValueError(f"Selection bitmask {hex(arg)} sets bits beyond the {size} items")
+            return arg
+        if kind == "indices":
+            mask = 0
+            for lo, hi in arg:
+                if hi >= size:
+                    raise ValueError(f"Selection index {hi} is out of range (0-{size - 1})")
+                mask |= ((1 << (hi - lo + 1)) - 1) << lo
+            return mask
+        if kind == "slice":
+            return sum(1 << i for i in range(size)[slice(*arg)])
+        if kind == "regex":
+            return self._where(arg.search)
+        if kind == "glob":
+            return self._where(re.compile(fnmatch.translate(arg)).match)
+        return self._where(lambda text: arg in text)
+
+    def _where(self, test):
+        mask = 0
+        for i, text in enumerate(self._folded):
+            if test(text):
+                mask |= 1 << i
+        return mask
+
+    def indices(self, mask):
+        return [i for i in range(len(self.items)) if mask >> i & 1]
+
+    def select(self, expression, start=0):
+        """Evaluate an expression on top of the `start` mask -> selected
+        items in vocabulary order."""
+        mask = start
+        for exclude, kind, arg in compile_selection(expression):
+            if kind == "none":
+                mask = 0
+            elif kind in ("random", "first"):
+                # Keeping from an empty selection keeps from every item
+                pool = self.indices(mask if exclude else mask or self.full)
+                if kind == "random":
+                    k, seed = arg
+                    picked = random.Random(seed).sample(pool, min(k, len(pool)))
+                else:
+                    picked = pool[:arg]
+                bits = sum(1 << i for i in picked)
+                mask = mask & ~bits if exclude else bits
+            elif exclude:
+                mask &= ~self.mask(kind, arg)
+            else:
+                mask |= self.mask(kind, arg)
+        return [self.items[i] for i in self.indices(mask)]
+
+
+@functools.lru_cache(maxsize=64)
+def vocabulary_index(items):
+    """Shared Vocabulary for a tuple of items."""
+    return Vocabulary(items)
+
+
+def _compile_term(term):
+    if term.lower() in ("all", "*"):
+        return "all", None
+    if term.lower() == "none":
+        return "none", None
+    m = _RANDOM.match(term)
+    if m:
+        return "random", (int(m.group(1)), int(m.group(2) or 0))
+    m = _FIRST.match(term)
+    if m:
+        return "first", int(m.group(1))
+    if term.lower().startswith("0x"):
+        try:
+            return "bits", int(term, 16)
+        except ValueError:
+            raise ValueError(f"Invalid selection bitmask '{term}'") from None
+    if _INDICES.match(term):
+        ranges = []
+        for part in term.split(","):
+            if part.strip():
+                lo, _, hi = part.partition("-")
+                lo = int(lo)
+                hi = int(hi) if hi.strip() else lo
+                if hi < lo:
+                    raise ValueError(f"Selection range '{part.strip()}' is reversed")
+                ranges.append((lo, hi))
+        return "indices", tuple(ranges)
+    m = _SLICE.match(term)
+    if m:
+        return "slice", tuple(int(g) if g else None for g in m.groups())
+    if len(term) > 1 and term.startswith("/") and term.endswith("/"):
+        try:
+            return "regex", re.compile(term[1:-1], re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid selection regex {term}: {e}") from e
+    if any(ch in term for ch in "*?["):
+        return "glob", term.lower()
+    return "text", term.lower()
+
+
+@functools.lru_cache(maxsize=256)
+def compile_selection(expression):
+    """Expression text -> tuple of (exclude, kind, arg) terms."""
+    terms = []
+    for term in _TERM_SPLIT.split(expression or ""):
+        term = term.strip()
+        if not term:
+            continue
+        exclude = term[0] == "-"
+        if term[0] in "+-":
+            term = term[1:].strip()
+            if not term:
+                raise ValueError("Empty selection term after '+' / '-'")
+        terms.append((exclude, *_compile_term(term)))
+    return tuple(terms)
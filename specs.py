@@ -0,0 +1,725 @@
+"""
+Index-addressable prompt spec spaces.
+A SpecSpace is the cartesian product of per-field option lists addressed by
+mixed-radix decoding: any cell of a multi-billion-combination sweep is
+reachable in O(fields) time and O(1) memory, without listing the space.
+
+Incompatible option pairs (Constraints) are compiled into per-option bitsets.
+A constrained SpecSpace counts valid completions per prefix, so indexing,
+iteration and sampling address only valid specs — nothing is generated and
+then rejected.
+"""
+
+import bisect
+import functools
+import itertools
+import json
+import math
+import random
+
+# Largest continued-fraction partial quotient accepted for a sampler stride
+# (Zaremba's bound: one exists for practically every modulus)
+_MAX_QUOTIENT = 5
+_STRIDE_HORIZON = 1 << 32
+
+# Prompt Builder settings carried by a PromptSpec, in prompt_json order
+PROMPT_SPEC_FIELDS = (
+    "subject", "pose", "action", "hairstyle", "hair_color", "scene_type",
+    "outfit", "edit_instructions", "environment", "lighting_setup",
+    "lighting_custom", "shot_type", "camera_angle", "lens", "depth_of_field",
+    "photo_style", "mood", "color_grading", "extra_details", "exposure",
+    "preserve_identity", "negative_prompt",
+)
+
+
+def _bits(mask):
+    """Yield the set bit positions of mask in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _max_quotient(a, n):
+    """Largest partial quotient of the continued fraction of a / n (a coprime
+    to n), up to convergents with denominators past _STRIDE_HORIZON — later
+    quotients only matter beyond that many samples."""
+    largest, q_prev, q = 0, 0, 1
+    while a and q <= _STRIDE_HORIZON:
+        quotient = n // a
+        if quotient > largest:
+            largest = quotient
+        q_prev, q = q, quotient * q + q_prev
+        n, a = a, n % a
+    return largest
+
+
+@functools.lru_cache(maxsize=64)
+def _golden_stride(n):
+    """Stride a coprime to n for the Weyl walk (a * i + b) mod n: the nearest
+    to n / phi (about 0.618 * n) whose continued fraction has only small
+    partial quotients. A large quotient makes a / n a near-rational, and the walk
+    then bunches into clusters of adjacent indices once it passes about
+    sqrt(n) samples."""
+    # n * F(k) // F(k+1) with F(k+1) > n is n / phi to the unit, where float
+    # arithmetic stops agreeing with it past 2**53
+    f, g = 0, 1
+    while g <= n:
+        f, g = g, f + g
+    start = max(1, n * f // g)
+    best, best_quotient = 1, n
+    for offset in range(min(n, 1 << 16)):
+        for a in (start + offset, start - offset):
+            if not 0 < a < n or math.gcd(a, n) != 1:
+                continue
+            quotient = _max_quotient(a, n)
+            if quotient < best_quotient:
+                best, best_quotient = a, quotient
+                if quotient <= _MAX_QUOTIENT:
+                    return best
+        if start + offset >= n and start - offset <= 0:
+            break
+    return best
+
+
+def _as_tuple(values):
+    return (values,) if isinstance(values, str) else tuple(values)
+
+
+class OptionList(list):
+    """Dropdown option list with O(1) membership tests. ComfyUI validates
+    every combo value with `value in options`; a plain list scans it.
+    The set is built on first use and dropped whenever the list changes."""
+
+    __slots__ = ("_set",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._set = None
+
+    def __contains__(self, value):
+        options = getattr(self, "_set", None)
+        if options is None:
+            options = self._set = frozenset(self)
+        try:
+            return value in options
+        except TypeError:  # unhashable value
+            return list.__contains__(self, value)
+
+    # Mutations invalidate the membership set
+
+    def __setitem__(self, index, value):
+        self._set = None
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._set = None
+        super().__delitem__(index)
+
+    def __iadd__(self, values):
+        self._set = None
+        return super().__iadd__(values)
+
+    def append(self, value):
+        self._set = None
+        super().append(value)
+
+    def extend(self, values):
+        self._set = None
+        super().extend(values)
+
+    def insert(self, index, value):
+        self._set = None
+        super().insert(index, value)
+
+    def remove(self, value):
+        self._set = None
+        super().remove(value)
+
+    def pop(self, index=-1):
+        self._set = None
+        return super().pop(index)
+
+    def clear(self):
+        self._set = None
+        super().clear()
+
+
+class Constraints:
+    """Pairwise incompatibility rules compiled into per-option bitsets.
+
+    vocabularies: {field: options}. rules: iterable of
+    (field_a, values_a, field_b, values_b) — every value in values_a is
+    incompatible with every value in values_b (either side may be a single
+    string). Rules naming fields or values outside the vocabularies are
+    ignored, so one rule table serves any sub-space."""
+
+    __slots__ = ("rules", "vocabularies", "_value_bits", "_masks")
+
+    def __init__(self, vocabularies, rules=()):
+        self.rules = tuple((fa, _as_tuple(va), fb, _as_tuple(vb)) for fa, va, fb, vb in rules)
+        self.vocabularies = {field: tuple(options) for field, options in vocabularies.items()}
+
+        # value -> bitmask of the codes carrying it (lists may repeat values)
+        self._value_bits = {}
+        for field, options in self.vocabularies.items():
+            bits = {}
+            for code, value in enumerate(options):
+                bits[value] = bits.get(value, 0) | (1 << code)
+            self._value_bits[field] = bits
+
+        # (field, value) -> {other_field: bitmask of forbidden codes}
+        self._masks = {}
+        for fa, va, fb, vb in self.rules:
+            if fa not in self._value_bits or fb not in self._value_bits:
+                continue
+            self._forbid(fa, va, fb, vb)
+            self._forbid(fb, vb, fa, va)
+
+    def _forbid(self, field, values, other, other_values):
+        other_bits = self._value_bits[other]
+        forbidden = 0
+        for v in other_values:
+            forbidden |= other_bits.get(v, 0)
+        if not forbidden:
+            return
+        for v in values:
+            if v in self._value_bits[field]:
+                masks = self._masks.setdefault((field, v), {})
+                masks[other] = masks.get(other, 0) | forbidden
+
+    def __bool__(self):
+        return bool(self._masks)
+
+    def forbidden_mask(self, field, value, other):
+        """Codes of `other` that may not appear alongside field=value."""
+        return self._masks.get((field, value), {}).get(other, 0)
+
+    def allowed(self, field, chosen):
+        """Options of `field` compatible with every value in `chosen`
+        ({field: value}), or None when nothing restricts the field."""
+        forbidden = 0
+        for f, v in chosen.items():
+            if f != field:
+                masks = self._masks.get((f, v))
+                if masks:
+                    forbidden |= masks.get(field, 0)
+        if not forbidden:
+            return None
+        options = self.vocabularies[field]
+        return {options[c] for c in range(len(options)) if not forbidden >> c & 1}
+
+    def is_valid(self, spec):
+        for f, v in spec.items():
+            masks = self._masks.get((f, v))
+            if not masks:
+                continue
+            for other, forbidden in masks.items():
+                if other in spec and forbidden & self._value_bits[other].get(spec[other], 0):
+                    return False
+        return True
+
+
+class SpecSpace:
+    """Cartesian product of per-field option lists, optionally restricted by
+    incompatibility rules.
+
+    axes: iterable of (field, values) pairs. The first field is the most
+    significant digit, so index order matches itertools.product order
+    (with invalid combinations left out when rules apply)."""
+
+    __slots__ = ("fields", "values", "radices", "size", "constraints",
+                 "_strides", "_lookup", "_allow", "_full", "_nodes")
+
+    def __init__(self, axes, rules=()):
+        axes = [(field, tuple(values)) for field, values in axes]
+        for field, values in axes:
+            if not values:
+                raise ValueError(f"SpecSpace field '{field}' has no options")
+        self.fields = tuple(field for field, _ in axes)
+        self.values = tuple(values for _, values in axes)
+        self.radices = tuple(len(values) for values in self.values)
+        self._lookup = tuple({v: i for i, v in enumerate(values)} for values in self.values)
+        self.constraints = Constraints(dict(axes), rules)
+
+        strides = []
+        size = 1
+        for radix in reversed(self.radices):
+            strides.append(size)
+            size *= radix
+        self._strides = tuple(reversed(strides))
+
+        self._allow = None
+        self._nodes = None
+        self._full = tuple((1 << r) - 1 for r in self.radices)
+        if self.constraints:
+            self._compile()
+            size = self._node(0, self._full)[3] if self.fields else 1
+        self.size = size
+
+    # ── Constrained space: bitset tables + valid-completion counts ──
+
+    def _compile(self):
+        """_allow[k][code] = masks of still-allowed codes for fields k+1..,
+        or None when the option restricts no later field."""
+        n = len(self.fields)
+        allow = []
+        for k, (field, values) in enumerate(zip(self.fields, self.values)):
+            row = []
+            for value in values:
+                masks = tuple(full & ~self.constraints.forbidden_mask(field, value, self.fields[j])
+                              for j, full in zip(range(k + 1, n), self._full[k + 1:]))
+                row.append(None if masks == self._full[k + 1:] else masks)
+            allow.append(row)
+        self._allow = allow
+        self._nodes = {}
+
+    def _node(self, k, masks):
+        """Prefix state at field k with remaining allowed masks ->
+        (codes, cumulative counts, child masks, total valid completions).
+        Memoized; only codes with at least one valid completion are kept."""
+        key = (k, masks)
+        node = self._nodes.get(key)
+        if node is not None:
+            return node
+        last = k == len(self.fields) - 1
+        rest = masks[1:]
+        codes, cum, kids = [], [], []
+        total = 0
+        for code in _bits(masks[0]):
+            allow = self._allow[k][code]
+            child = rest if allow is None else tuple(m & a for m, a in zip(rest, allow))
+            count = 1 if last else self._node(k + 1, child)[3]
+            if count:
+                total += count
+                codes.append(code)
+                cum.append(total)
+                kids.append(child)
+        node = (codes, cum, kids, total)
+        self._nodes[key] = node
+        return node
+
+    def _path(self, index):
+        """Nodes and positions visited while unranking index."""
+        path = []
+        masks = self._full
+        for k in range(len(self.fields)):
+            node = self._node(k, masks)
+            pos = bisect.bisect_right(node[1], index)
+            if pos:
+                index -= node[1][pos - 1]
+            path.append([node, pos])
+            masks = node[2][pos]
+        return path
+
+    # ── Public API ──
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        dims = " x ".join(f"{f}[{r}]" for f, r in zip(self.fields, self.radices))
+        rules = f", {len(self.constraints.rules)} rules" if self.constraints else ""
+        return f"SpecSpace({dims} = {self.size}{rules})"
+
+    def decode_codes(self, index):
+        """Index -> tuple of per-field option indices."""
+        if not 0 <= index < self.size:
+            raise IndexError(f"spec index {index} out of range for space of {self.size}")
+        if self._nodes is not None:
+            return tuple(node[0][pos] for node, pos in self._path(index))
+        codes = []
+        for stride in self._strides:
+            code, index = divmod(index, stride)
+            codes.append(code)
+        return tuple(codes)
+
+    def decode(self, index):
+        """Index -> {field: value} spec."""
+        return {field: values[code] for field, values, code
+                in zip(self.fields, self.values, self.decode_codes(index))}
+
+    def encode_codes(self, codes):
+        """Tuple of per-field option indices -> index."""
+        if self._nodes is None:
+            return sum(code * stride for code, stride in zip(codes, self._strides))
+        index = 0
+        masks = self._full
+        for k, code in enumerate(codes):
+            node = self._node(k, masks)
+            pos = bisect.bisect_left(node[0], code)
+            if pos == len(node[0]) or node[0][pos] != code:
+                raise ValueError(f"'{self.fields[k]}' = {self.values[k][code]!r} "
+                                 f"is incompatible with the rest of the spec")
+            if pos:
+                index += node[1][pos - 1]
+            masks = node[2][pos]
+        return index
+
+    def encode(self, spec):
+        """{field: value} spec -> index. Extra keys in spec are ignored."""
+        codes = []
+        for field, lookup in zip(self.fields, self._lookup):
+            value = spec.get(field)
+            if value not in lookup:
+                raise ValueError(f"{value!r} is not an option of '{field}'")
+            codes.append(lookup[value])
+        return self.encode_codes(codes)
+
+    def is_valid(self, spec):
+        return self.constraints.is_valid(spec)
+
+    def conflicting_fields(self):
+        """Fields whose rules leave no valid spec: those of the field pairs
+        with no compatible combination, else every field a rule restricts.
+        Empty when the space has valid specs."""
+        if self.size:
+            return ()
+        axes = list(zip(self.fields, self.values))
+        conflicts = set()
+        for i in range(len(axes)):
+            for j in range(i + 1, len(axes)):
+                if not SpecSpace((axes[i], axes[j]), self.constraints.rules).size:
+                    conflicts.update((axes[i][0], axes[j][0]))
+        if not conflicts:
+            conflicts = {f for fa, _, fb, _ in self.constraints.rules for f in (fa, fb)}
+        return tuple(f for f in self.fields if f in conflicts)
+
+    def iter_range(self, start=0, stop=None):
+        """Yield specs for indices [start, stop) with an odometer instead of
+        decoding each index from scratch."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return
+        if self._nodes is not None:
+            yield from self._iter_constrained(start, stop)
+            return
+        codes = list(self.decode_codes(start))
+        last = len(codes) - 1
+        for _ in range(stop - start):
+            yield {field: values[code] for field, values, code
+                   in zip(self.fields, self.values, codes)}
+            k = last
+            while k >= 0:
+                codes[k] += 1
+                if codes[k] < self.radices[k]:
+                    break
+                codes[k] = 0
+                k -= 1
+
+    def _iter_constrained(self, start, stop):
+        """Depth-first walk over valid specs only, resuming from start."""
+        path = self._path(start)
+        codes = [node[0][pos] for node, pos in path]
+        last = len(codes) - 1
+        for _ in range(stop - start):
+            yield {field: values[code] for field, values, code
+                   in zip(self.fields, self.values, codes)}
+            k = last
+            while k >= 0:
+                entry = path[k]
+                entry[1] += 1
+                if entry[1] < len(entry[0][0]):
+                    codes[k] = entry[0][0][entry[1]]
+                    break
+                k -= 1
+            if k < 0:
+                return
+            for j in range(k + 1, last + 1):
+                parent, pos = path[j - 1]
+                node = self._node(j, parent[2][pos])
+                path[j] = [node, 0]
+                codes[j] = node[0][0]
+
+    def shuffled(self, rng):
+        """Copy of this space (same rules) with each field's option order shuffled."""
+        axes = []
+        for field, values in zip(self.fields, self.values):
+            values = list(values)
+            rng.shuffle(values)
+            axes.append((field, values))
+        return SpecSpace(axes, self.constraints.rules)
+
+    def shard(self, worker, workers):
+        """Contiguous index range owned by one of `workers` queue workers."""
+        if not 0 <= worker < workers:
+            raise ValueError(f"worker {worker} out of range for {workers} workers")
+        per, extra = divmod(self.size, workers)
+        start = worker * per + min(worker, extra)
+        return range(start, start + per + (1 if worker < extra else 0))
+
+
+class SpecSampler:
+    """Unique, evenly spread specs drawn from a SpecSpace.
+
+    Sample i is the spec at index (a * i + b) mod N with a coprime to N,
+    a / N close to the golden ratio and free of large continued-fraction
+    quotients (_golden_stride), under a seeded shuffle of every field's
+    option order. That map is a bijection, so samples never repeat and no
+    duplicate check is needed; the stride is a Weyl low-discrepancy
+    sequence, so every field's options come up evenly (Latin-hypercube-like
+    coverage) for any prefix of the stream.
+
+    With rules, N counts valid specs only and the index is unranked through
+    the space's valid-completion counts (reordered per node, not recounted,
+    for the shuffle), so every sample is built valid — none is generated and
+    then rejected, and each costs the same whatever share of the product is
+    valid. Leading fields stay stratified; a deep field that rules restrict
+    is spread less evenly, since its options' index blocks shift from one
+    prefix to the next."""
+
+    __slots__ = ("space", "seed", "_order", "_position", "_a", "_b", "_nodes")
+
+    def __init__(self, space, seed=0):
+        rng = random.Random(f"kppb-sampler:{seed}")
+        self.space = space
+        self.seed = seed
+        order = []
+        for radix in space.radices:
+            codes = list(range(radix))
+            rng.shuffle(codes)
+            order.append(tuple(codes))
+        self._order = tuple(order)
+        # _position[k][code] = place of option `code` in field k's shuffled order
+        self._position = tuple(tuple(sorted(range(len(codes)), key=codes.__getitem__)) for codes in order)
+        n = space.size
+        if not n:
+            fields = ", ".join(space.conflicting_fields())
+            raise ValueError(f"SpecSampler: the space has no valid specs (conflicting fields: {fields})")
+        self._a = _golden_stride(n)
+        self._b = rng.randrange(n)
+        self._nodes = {}
+
+    def __len__(self):
+        return self.space.size
+
+    def _node(self, k, masks):
+        """space._node with its codes in this sampler's shuffled order ->
+        [codes, cumulative counts, child masks, child nodes (linked lazily)]."""
+        key = (k, masks)
+        node = self._nodes.get(key)
+        if node is None:
+            codes, cum, kids, _ = self.space._node(k, masks)
+            counts = [count - prev for count, prev in zip(cum, [0] + cum[:-1])]
+            children = sorted(zip(map(self._position[k].__getitem__, codes), codes, counts, kids))
+            node = [[child[1] for child in children],
+                    list(itertools.accumulate(child[2] for child in children)),
+                    [child[3] for child in children],
+                    [None] * len(children)]
+            self._nodes[key] = node
+        return node
+
+    def _codes(self, index):
+        """Index under the shuffled option order -> per-field option indices."""
+        space = self.space
+        codes = []
+        if space._nodes is None:
+            for order, stride in zip(self._order, space._strides):
+                digit, index = divmod(index, stride)
+                codes.append(order[digit])
+            return codes
+        last = len(space.fields) - 1
+        node = self._node(0, space._full)
+        for k in range(last + 1):
+            node_codes, cum, kids, links = node
+            pos = bisect.bisect_right(cum, index)
+            if pos:
+                index -= cum[pos - 1]
+            codes.append(node_codes[pos])
+            if k < last:
+                node = links[pos]
+                if node is None:
+                    node = links[pos] = self._node(k + 1, kids[pos])
+        return codes
+
+    def rank(self, i):
+        """Index of sample i under the sampler's shuffled option order."""
+        if not 0 <= i < self.space.size:
+            raise IndexError(f"sample {i} out of range, space has {self.space.size} unique specs")
+        return (self._a * i + self._b) % self.space.size
+
+    def sample(self, i):
+        codes = self._codes(self.rank(i))
+        return {field: values[code] for field, values, code
+                in zip(self.space.fields, self.space.values, codes)}
+
+    def iter_range(self, start=0, stop=None):
+        """Yield samples [start, stop) — O(fields) each, O(1) memory."""
+        n = self.space.size
+        stop = n if stop is None else min(stop, n)
+        fields, values = self.space.fields, self.space.values
+        a, b = self._a, self._b
+        for i in range(start, stop):
+            yield {field: vals[code] for field, vals, code
+                   in zip(fields, values, self._codes((a * i + b) % n))}
+
+    def take(self, count, start=0):
+        return list(self.iter_range(start, start + count))
+
+
+class WeightedSpecSampler:
+    """Distinct valid specs drawn in proportion to per-option weights,
+    without replacement.
+
+    A spec's weight is the product of its options' weights. Each draw
+    unranks one field at a time: an option is picked in proportion to the
+    weight of the valid completions below it, minus the weight already
+    drawn there (successive sampling). Drawn specs are therefore never drawn
+    again and nothing is rejected; the stream ends after space.size specs.
+
+    weights: {field: {option: weight}}; unlisted options weigh 1.0."""
+
+    __slots__ = ("space", "_weights", "_mass", "_drawn", "_rng", "_left")
+
+    def __init__(self, space, weights, rng):
+        self.space = space
+        self._weights = tuple(
+            tuple(float(weights.get(field, {}).get(v, 1.0)) for v in values)
+            for field, values in zip(space.fields, space.values))
+        if any(w <= 0 for row in self._weights for w in row):
+            raise ValueError("WeightedSpecSampler: weights must be positive "
+                             "(leave zero-weight options out of the space)")
+        self._mass = {}
+        # prefix codes -> {code: [drawn weight below prefix + code, drawn count]}
+        self._drawn = {}
+        self._rng = rng
+        self._left = space.size
+
+    def __len__(self):
+        return self.space.size
+
+    def _node(self, k, masks):
+        """SpecSpace prefix node plus each child's weight (option weight x
+        weight of its valid completions) and their running sums."""
+        key = (k, masks)
+        node = self._mass.get(key)
+        if node is None:
+            space = self.space
+            if space._nodes is not None:
+                codes, counts, kids, _ = space._node(k, masks)
+            else:  # unconstrained: every option, equal subtrees
+                codes = range(space.radices[k])
+                counts = [(code + 1) * space._strides[k] for code in codes]
+                kids = [masks[1:]] * space.radices[k]
+            last = k == len(space.fields) - 1
+            row = self._weights[k]
+            masses = [row[code] * (1.0 if last else self._node(k + 1, child)[3])
+                      for code, child in zip(codes, kids)]
+            cum = list(itertools.accumulate(masses))
+            prev = 0
+            sizes = []
+            for count in counts:
+                sizes.append(count - prev)
+                prev = count
+            node = self._mass[key] = (codes, kids, masses, cum[-1] if cum else 0.0, cum, sizes)
+        return node
+
+    def draw(self):
+        """Next distinct spec as {field: value}, or None once every valid spec
+        has been drawn."""
+        if self._left <= 0:
+            return None
+        rng = self._rng
+        masks = self.space._full
+        prefix = ()
+        for k in range(len(self.space.fields)):
+            codes, kids, masses, total, cum, sizes = self._node(k, masks)
+            drawn = self._drawn.get(prefix)
+            if drawn is None:
+                pos = min(bisect.bisect_right(cum, rng.random() * total), len(codes) - 1)
+            else:
+                # Scale the drawn weight below each child by its option weight
+                row = self._weights[k]
+                live = []
+                for i, code in enumerate(codes):
+                    mass, count = drawn.get(code, (0.0, 0))
+                    if count >= sizes[i]:
+                        live.append(0.0)
+                    else:
+                        live.append(max(masses[i] - row[code] * mass, 0.0) or 1e-300)
+                u = rng.random() * sum(live)
+                pos = next((i for i, acc in enumerate(itertools.accumulate(live)) if u < acc and live[i]),
+                           max(i for i, m in enumerate(live) if m))
+            prefix += (codes[pos],)
+            masks = kids[pos]
+
+        # Record the drawn spec's completion weight below every prefix
+        codes = prefix
+        tail = 1.0
+        for k in range(len(codes) - 1, -1, -1):
+            entry = self._drawn.setdefault(codes[:k], {}).setdefault(codes[k], [0.0, 0])
+            entry[0] += tail
+            entry[1] += 1
+            tail *= self._weights[k][codes[k]]
+        self._left -= 1
+        return {field: values[code] for field, values, code
+                in zip(self.space.fields, self.space.values, codes)}
+
+    def __iter__(self):
+        while True:
+            spec = self.draw()
+            if spec is None:
+                return
+            yield spec
+
+
+class PromptSpec:
+    """Immutable, hashable settings of one Prompt Builder result.
+
+    Passed between KPPB nodes as KPPB_SPEC so downstream nodes read fields
+    directly instead of parsing prompt_json; the hash doubles as a cheap
+    cache key. Attribute names match the prompt_json keys."""
+
+    __slots__ = PROMPT_SPEC_FIELDS + ("_hash",)
+
+    def __init__(self, items=(), **values):
+        values = dict(items, **values)
+        unknown = set(values) - set(PROMPT_SPEC_FIELDS)
+        if unknown:
+            raise TypeError(f"PromptSpec got unknown fields: {', '.join(sorted(unknown))}")
+        for field in PROMPT_SPEC_FIELDS:
+            object.__setattr__(self, field, values.get(field, "" if field != "preserve_identity" else True))
+        object.__setattr__(self, "_hash", hash(self.astuple()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PromptSpec is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PromptSpec is immutable")
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, PromptSpec):
+            return NotImplemented
+        return self._hash == other._hash and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        set_fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in PROMPT_SPEC_FIELDS
+                               if getattr(self, f) not in ("", None) and f != "negative_prompt")
+        return f"PromptSpec({set_fields})"
+
+    def __reduce__(self):
+        return (PromptSpec, (self.items(),))
+
+    def astuple(self):
+        return tuple(getattr(self, f) for f in PROMPT_SPEC_FIELDS)
+
+    def items(self):
+        return tuple(zip(PROMPT_SPEC_FIELDS, self.astuple()))
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in PROMPT_SPEC_FIELDS else default
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def to_json(self):
+        """Same text as the Prompt Builder's prompt_json output."""
+        return json.dumps(self.to_dict(), indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls((k, v) for k, v in data.items() if k in PROMPT_SPEC_FIELDS)
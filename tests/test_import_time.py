@@ -0,0 +1,49 @@
+"""
+Import-time regression test: loading the node pack the way ComfyUI does
+must not pull in numpy or Pillow (the VLM refiner imports them lazily).
+"""
+
+import functools
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "PIL")
+
+# Runs in a fresh interpreter so modules loaded by pytest don't leak in
+_CHILD = r"""
+import importlib.util, json, os, sys
+root = sys.argv[1]
+spec = importlib.util.spec_from_file_location(
+    "kppb_import_test", os.path.join(root, "__init__.py"), submodule_search_locations=[root])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+print(json.dumps({
+    "modules": sorted({m.split(".")[0] for m in sys.modules}),
+    "nodes": sorted(module.NODE_CLASS_MAPPINGS),
+}))
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _import_pack():
+    proc = subprocess.run([sys.executable, "-c", _CHILD, ROOT],
+                          capture_output=True, text=True, cwd=ROOT, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_pack_import_registers_nodes():
+    assert "KPPBVLMRefiner" in _import_pack()["nodes"]
+
+
+@pytest.mark.parametrize("module", HEAVY_MODULES)
+def test_pack_import_skips_heavy_module(module):
+    # A module that isn't installed can't be imported by accident
+    pytest.importorskip(module)
+    assert module not in _import_pack()["modules"], f"importing the node pack loaded {module}"
@@ -0,0 +1,134 @@
+"""
+Utility nodes for KPPB prompt lists.
+Deduplicate prompt lists before text encoding and scatter the encoded
+results back to the original order; canonicalize and hash prompts for
+cache keys and file names.
+"""
+
+import functools
+
+from .batch_nodes import _axis_values
+from .config import cached_input_types
+from .nodes import PROMPT_SPACE_FIELDS, RANDOM_FIELDS, _SKIP_RANDOM
+from .prompt_text import PromptCanonicalizer
+
+
+@functools.lru_cache(maxsize=1)
+def canonicalizer():
+    """PromptCanonicalizer knowing every dropdown option, spelled the way the
+    builders emit them (outfit pieces are lowercased by the Outfit Composer)."""
+    phrases = []
+    for field, options in RANDOM_FIELDS.items():
+        keep_case = field in PROMPT_SPACE_FIELDS
+        phrases.extend(o if keep_case else o.lower() for o in options if o not in _SKIP_RANDOM)
+    return PromptCanonicalizer(phrases)
+
+
+def dedupe(values):
+    """Unique values in first-seen order plus, for every input position, the
+    index of its value in the unique list."""
+    first = {}
+    index_map = [first.setdefault(v, len(first)) for v in values]
+    return list(first), index_map
+
+
+# ══════════════════════════════════════════════
+# PROMPT DEDUPE
+# ══════════════════════════════════════════════
+
+class KPPBPromptDedupe:
+    """Collapse a prompt list to its distinct strings so each one is encoded
+    once. index_map restores the original order (see Gather Conditioning)."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompts": ("STRING", {"forceInput": True,
+                                       "tooltip": "Prompt list, e.g. from Prompt Builder Batch"}),
+            },
+            "optional": {
+                "canonicalize": ("BOOLEAN", {"default": False,
+                                             "tooltip": "Treat prompts that only differ in whitespace, separators or phrase case as the same (outputs the canonical forms)"}),
+            },
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("STRING", "LIST", "INT", "FLOAT")
+    RETURN_NAMES = ("unique_prompts", "index_map", "unique_count", "dedup_ratio")
+    OUTPUT_IS_LIST = (True, False, False, False)
+    FUNCTION = "dedupe"
+    CATEGORY = "conditioning/klein"
+
+    def dedupe(self, prompts, canonicalize=(False,)):
+        prompts = _axis_values(prompts)
+        if canonicalize[0]:
+            canonical = canonicalizer().canonical
+            prompts = [canonical(p) for p in prompts]
+        unique, index_map = dedupe(prompts)
+        ratio = len(prompts) / len(unique) if unique else 1.0
+        print(f"[KPPB] Dedupe: {len(prompts)} prompts -> {len(unique)} unique ({ratio:.1f}x)")
+        return (unique, index_map, len(unique), ratio)
+
+
+# ══════════════════════════════════════════════
+# GATHER CONDITIONING
+# ══════════════════════════════════════════════
+
+class KPPBGatherConditioning:
+    """Expand conditioning encoded from Prompt Dedupe's unique_prompts back
+    to one entry per original prompt, in the original order."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "conditioning": ("CONDITIONING",),
+                "index_map": ("LIST", {"tooltip": "index_map output of Prompt Dedupe"}),
+            },
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("CONDITIONING",)
+    RETURN_NAMES = ("conditioning",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "gather"
+    CATEGORY = "conditioning/klein"
+
+    def gather(self, conditioning, index_map):
+        index_map = _axis_values(index_map)
+        if index_map and max(index_map) >= len(conditioning):
+            raise ValueError(f"index_map needs {max(index_map) + 1} conditioning entries, "
+                             f"got {len(conditioning)} — encode every unique prompt")
+        return ([conditioning[i] for i in index_map],)
+
+
+# ══════════════════════════════════════════════
+# CANONICAL PROMPT
+# ══════════════════════════════════════════════
+
+class KPPBCanonicalPrompt:
+    """Normalize a prompt (whitespace, sentence separators, case of known
+    phrases) and hash the result, so caches and file names key on meaning
+    rather than raw bytes."""
+
+    @classmethod
+    @cached_input_types
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompt": ("STRING", {"forceInput": True}),
+                "hash_length": ("INT", {"default": 16, "min": 4, "max": 64}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("canonical_prompt", "prompt_hash")
+    FUNCTION = "canonicalize"
+    CATEGORY = "conditioning/klein"
+
+    def canonicalize(self, prompt, hash_length=16):
+        canon = canonicalizer()
+        return (canon.canonical(prompt), canon.hash(prompt, hash_length))
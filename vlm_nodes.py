@@ -11,10 +11,10 @@ import io
 import re
 import urllib.request
 import urllib.error
-import numpy as np
-from PIL import Image as PILImage
 
+from .config import cached_input_types
 from .nodes import IDENTITY_LOCK_PROMPT
+from .specs import PromptSpec
 
 
 # ──────────────────────────────────────────────
@@ -24,8 +24,23 @@ from .nodes import IDENTITY_LOCK_PROMPT
 # Browser-like User-Agent — required for RunPod/Cloudflare proxied endpoints
 _UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
 
+def _image_modules():
+    """numpy and PIL.Image, imported on first use so that registering the node
+    doesn't load them at ComfyUI startup."""
+    try:
+        import numpy as np
+        from PIL import Image as PILImage
+    except ImportError as e:
+        raise RuntimeError(
+            f"VLM Prompt Refiner needs numpy and Pillow to encode reference images ({e}). "
+            "Install them with: pip install numpy pillow"
+        ) from e
+    return np, PILImage
+
+
 def _tensor_to_base64(image_tensor):
     """Convert a single ComfyUI IMAGE frame [H, W, C] float32 0-1 to base64 PNG."""
+    np, PILImage = _image_modules()
     img_np = (image_tensor.cpu().numpy() * 255).clip(0, 255).astype(np.uint8)
     pil_img = PILImage.fromarray(img_np)
     buf = io.BytesIO()
@@ -664,13 +679,19 @@ def _extract_video_prompt(text):
 # ──────────────────────────────────────────────
 
 def _make_filename_prefix(prompt_json="", mode=""):
-    """Build a descriptive filename prefix from scene settings JSON."""
+    """Build a descriptive filename prefix from scene settings — a PromptSpec
+    or prompt_json text."""
     parts = []
-    if prompt_json and prompt_json.strip():
+    if isinstance(prompt_json, PromptSpec):
+        data = prompt_json
+    elif prompt_json and prompt_json.strip():
         try:
             data = json.loads(prompt_json)
         except (json.JSONDecodeError, TypeError):
             data = {}
+    else:
+        data = None
+    if data is not None:
         # Pick the most descriptive fields
         for key in ("shot_type", "pose", "scene_type", "lighting_setup", "photo_style"):
             val = data.get(key, "")
@@ -793,6 +814,7 @@ class KPPBVLMRefiner:
     the character's physical identity with the user's scene settings."""
 
     @classmethod
+    @cached_input_types
     def INPUT_TYPES(cls):
         return {
             "required": {
@@ -834,6 +856,7 @@ class KPPBVLMRefiner:
                                              "placeholder": "Override video motion (e.g. 'slowly turns head, hair flowing in wind')"}),
                 "audio_prompt": ("STRING", {"multiline": True, "default": "",
                                             "placeholder": "Audio: speech, tone, background sounds (e.g. 'She whispers \"Hey there\" softly, cafe ambience, gentle jazz')"}),
+                "spec": ("KPPB_SPEC", {"tooltip": "Connect from Prompt Builder's spec output — used instead of parsing prompt_json"}),
             },
         }
 
@@ -865,7 +888,15 @@ class KPPBVLMRefiner:
         generate_video_prompt=False,
         motion_prompt="",
         audio_prompt="",
+        spec=None,
     ):
+        # A connected spec supplies the scene settings directly
+        settings = prompt_json
+        if spec is not None:
+            settings = spec
+            if not (prompt_json and prompt_json.strip()):
+                prompt_json = spec.to_json()
+
         # ── Encode all images to base64 (needed by both paths) ──
         images_b64 = []
         if character_ref.dim() == 4:
@@ -995,7 +1026,7 @@ class KPPBVLMRefiner:
             if mode == "dataset generation":
                 gen_prompt, caption, ds_vid = _parse_dataset_json(result, trigger_word)
                 if gen_prompt:
-                    fname = _make_filename_prefix(prompt_json, mode)
+                    fname = _make_filename_prefix(settings, mode)
                     print(f"[KPPB] ═══ DATASET OUTPUT ═══")
                     print(f"[KPPB] Generation prompt ({len(gen_prompt)} chars): {gen_prompt[:300]}")
                     print(f"[KPPB] Training caption ({len(caption)} chars): {caption[:300]}")
@@ -1018,7 +1049,7 @@ class KPPBVLMRefiner:
             if preserve_identity:
                 result = result.rstrip(". ") + ". " + IDENTITY_LOCK_PROMPT + "."
 
-            fname = _make_filename_prefix(prompt_json, mode)
+            fname = _make_filename_prefix(settings, mode)
             print(f"[KPPB] ═══ FINAL OUTPUT ({len(result)} chars) ═══")
             print(f"[KPPB] {result[:500]}")
             # Claude mode returns same for both outputs (no separate caption stage)
@@ -1136,7 +1167,7 @@ class KPPBVLMRefiner:
         if is_dataset:
             gen_prompt, caption, ds_vid = _parse_dataset_json(result, trigger_word)
             if gen_prompt:
-                fname = _make_filename_prefix(prompt_json, mode)
+                fname = _make_filename_prefix(settings, mode)
                 print(f"[KPPB] ═══ DATASET OUTPUT ═══")
                 print(f"[KPPB] Generation prompt ({len(gen_prompt)} chars): {gen_prompt[:300]}")
                 print(f"[KPPB] Training caption ({len(caption)} chars): {caption[:300]}")
@@ -1170,7 +1201,7 @@ class KPPBVLMRefiner:
         if preserve_identity:
             result = result.rstrip(". ") + ". " + IDENTITY_LOCK_PROMPT + "."
 
-        fname = _make_filename_prefix(prompt_json, mode)
+        fname = _make_filename_prefix(settings, mode)
         print(f"[KPPB] ═══ FINAL OUTPUT ({len(result)} chars) ═══")
         print(f"[KPPB] {result[:500]}")
 